@@ -1,6 +1,5 @@
 # TODO: this crap is too interdependent.
 
-import functools
 import struct
 from typing import Dict, List, Optional
 
@@ -20,9 +19,41 @@ def _byte(value):
 	return bytes(value.to_bytes(1, 'big'))
 
 
+# Space-separated sorted field names -> Format subclass, filled in as the classes are defined.
+# JSON deserialization uses it to tell which record a dictionary is.
+format_by_fields = {}
+
+
 class Format():
+	_fields = ()
+	_struct = struct.Struct('<')
+	# Set to True in a subclass to let the parser return lazy views (see `RecordView`) of it.
+	_lazy = False
+	# Fields that `_from_alm` converts; a view decodes them together.
+	_alm_fields = ()
+	# Set to False in a subclass that is not a map record, so JSON maps are never decoded into it.
+	_map_record = True
+
+	def __init_subclass__(cls, **kwargs):
+		super().__init_subclass__(**kwargs)
+		if '_view_of' in cls.__dict__:
+			return
+
+		# Class attributes in definition order are the record layout. Note that `as_struct`,
+		# `from_unpacked` and other methods are not in the subclass `__dict__`.
+		cls._fields = tuple((k, v) for k, v in cls.__dict__.items() if not k.startswith('_'))
+		cls._struct = struct.Struct('<' + ''.join(Format._symbol(v) for k, v in cls._fields))
+
+		if not cls.__dict__.get('_map_record', True):
+			return
+
+		fields = ' '.join(sorted(k for k, v in cls._fields))
+		if fields in format_by_fields:
+			assert False, f'fields for {format_by_fields[fields]} and {cls} are identical --- {fields}'
+		format_by_fields[fields] = cls
+
 	def __init__(self, **kwargs) -> None:
-		have_keys = {k for k in self.__class__.__dict__.keys() if not k.startswith('_')}
+		have_keys = {k for k, v in self._fields}
 
 		for k, v in kwargs.items():
 			if k not in have_keys:
@@ -51,15 +82,12 @@ class Format():
 		assert False, f'type {type(data_type)} is not supported in Format._symbol'
 
 	@classmethod
-	@functools.lru_cache
 	def as_struct(cls):
-		# Note that this doesn't iterate over `as_struct`, `from_unpacked` and other similar
-        # methods because they're class methods or static methods. Yeah, it's weird.
-		return '<' + ''.join(Format._symbol(v) for k, v in cls.__dict__.items() if not k.startswith('_'))
+		return cls._struct.format
 
 	@classmethod
 	def size(cls):
-		return struct.calcsize(cls.as_struct())
+		return cls._struct.size
 
 	@staticmethod
 	def _unpack(data_type, unpacked, pos):
@@ -111,39 +139,59 @@ class Format():
 			assert False, f'type {type(data_type)} (value {data_type!r}) is not supported in Format._pack'
 
 	@classmethod
-	def from_unpacked(cls, unpacked):
+	def from_unpacked(cls, unpacked, convert=True):
+		# Without `convert`, the fields `_from_alm` converts keep their values from the file.
 		i = 0
 		new = cls()
-		for k, v in cls.__dict__.items():
-			if not k.startswith('_'):
-				value, delta = Format._unpack(v, unpacked, i)
-				i += delta
-				setattr(new, k, value)
-		new._from_alm()
+		for k, v in cls._fields:
+			value, delta = Format._unpack(v, unpacked, i)
+			i += delta
+			setattr(new, k, value)
+		if convert:
+			new._from_alm()
 		return new
 
 	@classmethod
-	def to_packed(cls, value):
-		res = []
+	def to_packed(cls, value, overrides=None):
+		# `overrides` are wire values that replace the record's own. The record is only read,
+		# so records shared between threads can be packed concurrently.
+		wire = value._alm_values()
+		if overrides:
+			wire.update(overrides)
 
-		value._to_alm()
-		for k, v in cls.__dict__.items():
-			if not k.startswith('_'):
-				res.extend(Format._pack(v, getattr(value, k)))
-
-		value._from_alm()
+		res = []
+		for k, v in cls._fields:
+			res.extend(Format._pack(v, wire[k] if k in wire else getattr(value, k)))
 
 		return res
 
-	def _from_alm(self):
-		pass
+	def pack(self, overrides=None) -> bytes:
+		return self._struct.pack(*self.to_packed(self, overrides))
 
-	def _to_alm(self):
+	@classmethod
+	def view(cls, buffer, offset=0):
+		if '_view_class' not in cls.__dict__:
+			namespace = {k: LazyField(k) for k, v in cls._fields}
+			namespace.update(_view_of=cls, _layout=RecordView.layout(cls))
+			cls._view_class = type(f'{cls.__name__}View', (RecordView, cls), namespace)
+		view = cls._view_class.__new__(cls._view_class)
+		view._buffer = buffer
+		view._offset = offset
+		return view
+
+	def materialize(self):
+		return self
+
+	def _from_alm(self, checked=True):
 		pass
 
+	def _alm_values(self):
+		# Wire values of the fields that `_from_alm` converts.
+		return {}
+
 	def __str__(self):
 		res = []
-		for k, v in self.__dict__.items():
+		for k, v in self.materialize().__dict__.items():
 			res.append(f'{k}: {v}')
 		return ', '.join(res)
 
@@ -151,12 +199,90 @@ class Format():
 		return self.__str__()
 
 
-def coordinate_from_alm(c):
+class LazyField:
+	# Decodes the field of a `RecordView` on first access; the value is then stored in the
+	# instance `__dict__`, which takes precedence over this descriptor.
+	def __init__(self, name):
+		self.name = name
+
+	def __get__(self, instance, owner=None):
+		if instance is None:
+			return self
+		return instance._load(self.name)
+
+
+class RecordView:
+	# A record that keeps the buffer it was read from and decodes each field on first access.
+	# Views are created by `Format.view`; their class is a subclass of the record class.
+	# Setting a field, `materialize()` or serialization decode the whole record; after that
+	# it behaves exactly like the plain record. Fields without storage (`items = None`, ...)
+	# can be set without decoding anything.
+	__slots__ = ('_buffer', '_offset')
+
+	@staticmethod
+	def layout(cls):
+		# field -> (data type, offset in the record, struct of the field)
+		layout = {}
+		position = 0
+		for k, v in cls._fields:
+			symbols = Format._symbol(v)
+			layout[k] = (v, position, struct.Struct('<' + symbols))
+			position += struct.calcsize('<' + symbols)
+		return layout
+
+	def _decode(self, name):
+		data_type, position, field_struct = self._layout[name]
+		position += self._offset
+		if isinstance(data_type, str):
+			s = self._buffer[position:position + field_struct.size]
+			if b'\x00' in s:
+				s = s[:s.index(b'\x00')]
+			return s.decode('cp1251')
+		return Format._unpack(data_type, field_struct.unpack_from(self._buffer, position), 0)[0]
+
+	def _load(self, name):
+		cls = self._view_of
+		if name in cls._alm_fields:
+			plain = cls.__new__(cls)
+			for k in cls._alm_fields:
+				setattr(plain, k, self._decode(k))
+			plain._from_alm()
+			self.__dict__.update(plain.__dict__)
+		else:
+			self.__dict__[name] = self._decode(name) if self._layout[name][0] is not None else None
+		return self.__dict__[name]
+
+	def __setattr__(self, name, value):
+		if name in self._layout and self._layout[name][0] is not None:
+			self.materialize()
+		object.__setattr__(self, name, value)
+
+	def materialize(self):
+		if self._buffer is not None:
+			values = {k: getattr(self, k) for k, v in self._view_of._fields}
+			self.__dict__.clear()
+			self.__dict__.update(values)
+			object.__setattr__(self, '_buffer', None)
+		return self
+
+	def __reduce_ex__(self, protocol):
+		# Copies and pickles are plain records.
+		return _plain_record, (self._view_of, dict(self.materialize().__dict__))
+
+
+def _plain_record(cls, fields):
+	record = cls.__new__(cls)
+	record.__dict__.update(fields)
+	return record
+
+
+def coordinate_from_alm(c, checked=True):
+	# Unchecked, a coordinate that is not the centre of a cell is rounded down to its cell.
 	c = c - 128
-	assert c % 256 == 0
-	c = c // 256
-	assert c >= 0
-	return c
+	if checked:
+		assert c % 256 == 0
+		assert c >= 0
+	return c // 256
 
 
 def coordinate_to_alm(c):
@@ -164,13 +290,14 @@ def coordinate_to_alm(c):
 
 
 class Coordinate():
-	def _from_alm(self):
-		self.x = coordinate_from_alm(self.x)
-		self.y = coordinate_from_alm(self.y)
+	_alm_fields = ('x', 'y')
+
+	def _from_alm(self, checked=True):
+		self.x = coordinate_from_alm(self.x, checked)
+		self.y = coordinate_from_alm(self.y, checked)
 
-	def _to_alm(self):
-		self.x = coordinate_to_alm(self.x)
-		self.y = coordinate_to_alm(self.y)
+	def _alm_values(self):
+		return {'x': coordinate_to_alm(self.x), 'y': coordinate_to_alm(self.y)}
 
 
 class Header(Format):
@@ -190,6 +317,8 @@ class SectionHeader(Format):
 
 
 class GenericInfo(Format):
+	_lazy = True
+
 	width = int(4)
 	height = int(4)
 	sun_angle = int(4)
@@ -249,6 +378,8 @@ class BridgeSize(Format):
 
 
 class Player(Format):
+	_lazy = True
+
 	color = int(4)
 	flags = Hex(4)
 	money = int(4)
@@ -280,6 +411,8 @@ class Instances(Format):
 
 
 class Instance(Format):
+	_lazy = True
+
 	name = str(64)
 	type_id = int(4)
 	index = int(4)
@@ -290,6 +423,8 @@ class Instance(Format):
 
 
 class Trigger(Format):
+	_lazy = True
+
 	name = str(128)
 	check_ids = [int(4)] * 6
 	instance_ids = [int(4)] * 4
@@ -350,6 +485,8 @@ class Inn(Format):
 
 
 class Shop(Format):
+	_lazy = True
+
 	shop_id = int(4)
 	shelf_flags = [Hex(4)] * 4
 	min_price = [int(4)] * 4
@@ -0,0 +1,134 @@
+import collections
+import csv
+import json
+
+import a2data
+import common
+import parser
+import resfile
+
+
+columns = ['statistic', 'map_level', 'key', 'name', 'value']
+
+statistics = [
+	'maps',
+	'gold',
+	'item_drops',
+	'item_wields',
+	'effect_spells',
+	'effect_modifiers',
+	'shop_price_bands',
+]
+
+
+def map_stats(allods_map: a2data.AllodsMap):
+	# Statistics of one map: statistic -> Counter keyed by (map_level, key).
+	level = allods_map.info.map_level
+	stats = {name: collections.Counter() for name in statistics}
+
+	stats['maps'][level, ''] += 1
+
+	for bag in allods_map.bags:
+		stats['gold'][level, ''] += bag.gold
+
+		for item in bag.items:
+			stats['item_wields' if item.wielded else 'item_drops'][level, int(item.item_id)] += 1
+
+			if 0 < item.effect <= len(allods_map.effects):
+				effect = allods_map.effects[item.effect - 1]
+				if effect.spell_type_id:
+					stats['effect_spells'][level, effect.spell_type_id] += 1
+				for modifier in effect.modifiers:
+					stats['effect_modifiers'][level, modifier.x] += 1
+
+	for shop in allods_map.shops:
+		for min_price, max_price, max_items in zip(shop.min_price, shop.max_price, shop.max_items):
+			if max_items:
+				stats['shop_price_bands'][level, f'{min_price}-{max_price}'] += 1
+
+	return stats
+
+
+def file_stats(fname):
+	# Returns (statistics, None), or (None, error message) for a map that cannot be read.
+	try:
+		return map_stats(parser.parse(fname, lazy=True)), None
+	except (parser.ParseException, OSError) as error:
+		return None, common.error_message(error)
+
+
+def stats_by_file(filenames, jobs=1):
+	# Yields (file, statistics, error) in the order of `filenames`.
+	if jobs <= 1:
+		for f in filenames:
+			yield (f, *file_stats(f))
+		return
+
+	import concurrent.futures
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+		for f, (stats, error) in zip(filenames, executor.map(file_stats, filenames, chunksize=8)):
+			yield f, stats, error
+
+
+def totals():
+	return {name: collections.Counter() for name in statistics}
+
+
+def merge(total, stats):
+	for name, counter in stats.items():
+		total[name].update(counter)
+	return total
+
+
+def _namer(engine_data: parser.EngineData, table):
+	# Names are best effort: without game data the column stays empty. Keys outside of the
+	# tables are checked below.
+	try:
+		names = getattr(engine_data, table)
+	except (OSError, resfile.ResException, parser.ParseException):
+		return lambda key: ''
+
+	if table == 'spell_names':
+		return lambda key: names[key - 1] if 0 < key <= len(names) else ''
+	if table == 'item_modifiers':
+		return lambda key: names[key] if 0 <= key < len(names) else ''
+	return lambda key: names.get(key, '')
+
+
+def aggregate_rows(total, engine_data: parser.EngineData):
+	tables = {
+		'item_drops': 'item_names',
+		'item_wields': 'item_names',
+		'effect_spells': 'spell_names',
+		'effect_modifiers': 'item_modifiers',
+	}
+	namers = {}
+
+	rows = []
+	for name in statistics:
+		namer = lambda key: ''
+		if name in tables and total[name]:
+			if tables[name] not in namers:
+				namers[tables[name]] = _namer(engine_data, tables[name])
+			namer = namers[tables[name]]
+
+		for (level, key), value in sorted(total[name].items()):
+			rows.append({
+				'statistic': name,
+				'map_level': level,
+				'key': key,
+				'name': namer(key) if isinstance(key, int) else '',
+				'value': value,
+			})
+	return rows
+
+
+def write_rows(rows, output_format, out):
+	if output_format == 'json':
+		json.dump(rows, out, indent=4, ensure_ascii=False)
+		out.write('\n')
+		return
+
+	writer = csv.DictWriter(out, fieldnames=columns, lineterminator='\n')
+	writer.writeheader()
+	writer.writerows(rows)
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import argparse
-from colorama import Fore, Back, Style
 import collections
 import io
 import json
@@ -11,28 +10,40 @@ import shutil
 import sys
 
 import a2data
+import catalog
+import common
+import compression
 import marshaller
+import metrics
 import parser
 
+# Modules that are only needed by some modes (colorama, NumPy via terrain, ...) are imported
+# where they are used: the script is started for every single map by other scripts.
+
+
+def _colored(color, amount):
+	from colorama import Fore, Style
+	return getattr(Fore, color) + str(amount) + Style.RESET_ALL
+
 
 def color_amount(amount):
-	return Fore.YELLOW + str(amount) + Style.RESET_ALL
+	return _colored('YELLOW', amount)
 
 
 def color_magic(amount):
-	return Fore.BLUE + str(amount) + Style.RESET_ALL
+	return _colored('BLUE', amount)
 
 
 def color_modifier(amount):
-	return Fore.MAGENTA + str(amount) + Style.RESET_ALL
+	return _colored('MAGENTA', amount)
 
 
 def color_error(amount):
-	return Fore.RED + str(amount) + Style.RESET_ALL
+	return _colored('RED', amount)
 
 
 def color_reference(amount):
-	return Fore.GREEN + str(amount) + Style.RESET_ALL
+	return _colored('GREEN', amount)
 
 
 def spell(engine_data: parser.EngineData, spell_id: int, power: int):
@@ -139,23 +150,15 @@ def render_triggers(map_info, engine_data, emit):
 class JsonEncoder(json.JSONEncoder):
 	def default(self, o):
 		if isinstance(o, a2data.Format):
-			return o.__dict__
+			return o.materialize().__dict__
 		return json.JSONEncoder.default(self, o)
 
 
-format_by_fields = {}
-for cls in a2data.Format.__subclasses__():
-	fields = ' '.join(sorted(field for field in dir(cls) if not field.startswith('_') and field not in ('as_struct', 'size', 'from_unpacked', 'to_packed')))
-	if fields in format_by_fields:
-		assert False, f'fields for {format_by_fields[fields]} and {cls} are identical --- {fields}'
-	format_by_fields[fields] = cls
-
-
 def json_decode(d: dict):
 	fields = ' '.join(sorted(d.keys()))
-	if fields not in format_by_fields:
+	if fields not in a2data.format_by_fields:
 		return d
-	return format_by_fields[fields](**d)
+	return a2data.format_by_fields[fields](**d)
 
 
 def map_rename(fname, map_info):
@@ -171,19 +174,108 @@ def diplomacy_title(d):
 	return 'neutral' + suffix
 
 
-def process_file(fname, engine_data, args):
-	if fname.endswith('.json'):
-		with open(fname, 'r') as fin:
-			map_info = json.load(fin, object_hook=json_decode)
-	else:
-		map_info = parser.parse(fname)
+def load_map(fname, lazy=False) -> a2data.AllodsMap:
+	if compression.base_name(fname).endswith('.json'):
+		with compression.open_file(fname, 'r') as fin:
+			try:
+				return json.load(fin, object_hook=json_decode)
+			except ValueError as error:
+				raise parser.ParseException(f'failed to parse {fname!r}') from error
+	return parser.parse(fname, lazy)
+
+
+def terrain_report(filenames, args, run_metrics):
+	import terrain
+
+	all_stats = []
+	failed = 0
+	for f in filenames:
+		try:
+			with run_metrics.stage('parse'):
+				if compression.base_name(f).endswith('.json'):
+					layers = terrain.layers_from_map(load_map(f))
+				else:
+					layers = terrain.load_layers(f)
+		except (parser.ParseException, OSError) as error:
+			run_metrics.file_done(f, failed=True)
+			print(common.error_message(error), file=sys.stderr)
+			failed += 1
+			continue
+		run_metrics.file_done(f)
+
+		with run_metrics.stage('analyze'):
+			stats = terrain.terrain_stats(layers)
+		all_stats.append(stats)
+		if args.output_format in ('json', 'jsonl'):
+			print(json.dumps({'file': f, **stats}, ensure_ascii=False))
+		else:
+			print(terrain.format_stats(f, stats), end='')
+
+	if len(all_stats) > 1:
+		summary = terrain.corpus_summary(all_stats)
+		if args.output_format in ('json', 'jsonl'):
+			print(json.dumps({'summary': summary}, ensure_ascii=False))
+		else:
+			print(terrain.format_summary(summary), end='')
+	return failed
+
+
+def scan_report(filenames, args, run_metrics):
+	damaged = 0
+	for f in filenames:
+		with run_metrics.stage('parse'):
+			map_info, diagnostics = parser.scan(f)
+		# Damaged maps are what this mode is for, only those that could not be read at all failed.
+		run_metrics.file_done(f, failed=map_info is None)
+		if diagnostics:
+			damaged += 1
+
+		if args.output_format in ('json', 'jsonl'):
+			print(json.dumps({'file': f, 'readable': map_info is not None, 'diagnostics': diagnostics}, ensure_ascii=False))
+			continue
+
+		for d in diagnostics:
+			where = ''
+			if d['section'] is not None:
+				where += f' section {d["section"]}'
+			if d['offset'] is not None:
+				where += f' at {d["offset"]}'
+			print(f'{f}:{where} {d["severity"]}: {d["message"]}')
+
+	print(f'{damaged} of {len(filenames)} maps have problems', file=sys.stderr)
+
+
+def validate_report(filenames, args, run_metrics):
+	import validate
+
+	counts = collections.Counter()
+	for f, findings, readable in run_metrics.each_file(validate.validate_files(filenames, args.jobs)):
+		run_metrics.file_done(f, failed=not readable)
+		counts.update(finding['severity'] for finding in findings)
+
+		if args.output_format in ('json', 'jsonl'):
+			print(json.dumps({'file': f, 'findings': findings}, ensure_ascii=False))
+			continue
+
+		for finding in findings:
+			print(f'{f}: {finding["severity"]}: {finding["check"]}: {finding["message"]}')
+
+	summary = ', '.join(f'{counts[severity]} {severity}s' for severity in validate.severities)
+	print(f'{len(filenames)} maps: {summary}', file=sys.stderr)
+
+
+def process_file(fname, engine_data, args, map_info=None):
+	if map_info is None:
+		map_info = load_map(fname, lazy=args.output_format == 'text' and not args.save)
 
 	print(f'{fname}: {map_info.info.map_name}', file=sys.stderr)
 
 	if args.save:
 		result_file = os.path.join(args.save, os.path.basename(fname))
-		if result_file.endswith('.json'):
-			result_file = result_file[:-5] + '.alm'
+		base = compression.base_name(result_file)
+		if base.endswith('.json'):
+			# map.json.gz -> map.alm.gz
+			result_file = base[:-5] + '.alm' + result_file[len(base):]
 		marshaller.marshal(map_info, result_file)
 		return
 
@@ -432,14 +524,264 @@ def main():
 	arg_parser.add_argument('-l', '--level')
 	arg_parser.add_argument('-m', '--monsters')
 	arg_parser.add_argument('--drops_potions', type=int)
+	arg_parser.add_argument('--drops', type=int, help='list monsters dropping --drop_mask items at this price, -1 for any')
+	arg_parser.add_argument('--drop_mask', type=lambda x: int(x, 0), default=None, help='drop_mask categories for --drops, books and potions (0x4000000) by default')
 	arg_parser.add_argument('--has_magic', type=int)
 	arg_parser.add_argument('--output_directory', default=None)
 	arg_parser.add_argument('--categorize')
-	arg_parser.add_argument('--output_format', default='text', choices=['text', 'json'])
+	arg_parser.add_argument('--output_format', default='text', choices=['text', 'json', 'jsonl'])
 	arg_parser.add_argument('-s', '--save')
+	arg_parser.add_argument('--catalog', choices=['tsv', 'csv', 'json'])
+	arg_parser.add_argument('-j', '--jobs', type=int, default=1)
+	arg_parser.add_argument('--terrain_stats', action='store_true')
+	arg_parser.add_argument('--reachability', action='store_true')
+	arg_parser.add_argument('--aggregate', choices=['csv', 'json'])
+	arg_parser.add_argument('--validate', action='store_true', help='check references, bounds and IDs in every map')
+	arg_parser.add_argument('--scan', action='store_true', help='report damaged sections instead of failing on them')
+	arg_parser.add_argument('--transform', help='JSON list of edits or a Python file defining transform(allods_map)')
+	arg_parser.add_argument('--paste_region', metavar='SOURCE', help='copy --box from this map into every given map at --at')
+	arg_parser.add_argument('--box', help='x,y,width,height')
+	arg_parser.add_argument('--at', help='x,y of the pasted box, defaults to the --box position')
+	arg_parser.add_argument('--dry_run', action='store_true')
+	arg_parser.add_argument('--in_place', action='store_true')
+	arg_parser.add_argument('--minimap')
+	arg_parser.add_argument('--minimap_overlays', default='', help='comma-separated: units,buildings,bags,effects')
+	arg_parser.add_argument('--minimap_scale', type=int, default=1)
+	arg_parser.add_argument('--memory_report', action='store_true', help='JSON lines with the memory taken by every map')
+	arg_parser.add_argument('--dedupe', action='store_true', help='group identical and near-identical maps')
+	arg_parser.add_argument('--dedupe_cache', help='file to keep section hashes in between runs')
+	arg_parser.add_argument('--unit_table', choices=['csv', 'jsonl', 'bin'], help='export all unit kinds from data.bin')
+	arg_parser.add_argument('--metrics', help='write Prometheus textfile metrics of the run to this file')
+	arg_parser.add_argument('--metrics_interval', type=float, default=60, help='seconds between metrics updates during the run')
+	arg_parser.add_argument('--unit_filter', help='expression over unit table columns, e.g. "category == \'monster\' and hp > 1000"')
 	args = arg_parser.parse_args()
 
-	engine_data = parser.parse_engine_data(args.allods_data_directory, args.filename)
+	run_metrics = metrics.Metrics(args.metrics, args.metrics_interval, run_mode(args))
+	run_metrics.start()
+	succeeded = False
+	try:
+		run(args, arg_parser, run_metrics)
+		succeeded = True
+	finally:
+		run_metrics.close(succeeded)
+
+
+def run_mode(args):
+	modes = ['catalog', 'terrain_stats', 'scan', 'validate', 'memory_report', 'dedupe', 'aggregate', 'transform', 'paste_region', 'minimap']
+	for mode in modes:
+		if getattr(args, mode):
+			return mode
+	if args.output_format == 'jsonl' and not args.save:
+		return 'jsonl'
+	for mode in ['reachability', 'unit_table', 'monsters', 'drops', 'drops_potions', 'has_magic', 'save']:
+		if getattr(args, mode) not in (None, False):
+			return mode
+	return 'report'
+
+
+def run(args, arg_parser, run_metrics: metrics.Metrics):
+	args.filename = list(catalog.find_maps(args.filename))
+
+	if args.catalog:
+		rows = []
+		failed = 0
+		for f, row, error in run_metrics.each_file(catalog.catalog_rows(args.filename, args.jobs)):
+			run_metrics.file_done(f, failed=error is not None, bytes_read=catalog.catalog_size)
+			if error is not None:
+				print(error, file=sys.stderr)
+				failed += 1
+			else:
+				rows.append(row)
+		with run_metrics.stage('output'):
+			catalog.write_catalog(rows, args.catalog, sys.stdout)
+		if failed:
+			print(f'{failed} of {len(args.filename)} maps could not be read', file=sys.stderr)
+			sys.exit(1)
+		return
+
+	if args.terrain_stats:
+		failed = terrain_report(args.filename, args, run_metrics)
+		if failed:
+			print(f'{failed} of {len(args.filename)} maps could not be read', file=sys.stderr)
+			sys.exit(1)
+		return
+
+	if args.scan:
+		scan_report(args.filename, args, run_metrics)
+		return
+
+	if args.validate:
+		validate_report(args.filename, args, run_metrics)
+		return
+
+	if args.memory_report:
+		import memory
+
+		reports = []
+		for f in args.filename:
+			with run_metrics.file(f), run_metrics.stage('parse'):
+				report = memory.measure(f, load_map)
+			print(json.dumps(report), flush=True)
+			reports.append(report)
+		print(json.dumps({'summary': memory.summarize(reports)}))
+		return
+
+	if args.dedupe:
+		import dedupe
+
+		cache = dedupe.HashCache(args.dedupe_cache)
+		entries = {}
+		for f, entry in run_metrics.each_file(dedupe.hash_files(args.filename, cache, args.jobs)):
+			run_metrics.file_done(f, failed='error' in entry)
+			entries[f] = entry
+		run_metrics.cache('dedupe', cache.hits, cache.misses)
+		with run_metrics.stage('analyze'):
+			exact, near, errors = dedupe.find_duplicates(entries)
+		with run_metrics.stage('output'):
+			if args.output_format == 'text':
+				print(dedupe.format_report(exact, near, errors), end='')
+			else:
+				print(json.dumps({'exact': exact, 'near': near, 'errors': errors}, indent=4, ensure_ascii=False))
+		return
+
+	if args.aggregate:
+		import aggregate
+
+		total = aggregate.totals()
+		failed = 0
+		for f, stats, error in run_metrics.each_file(aggregate.stats_by_file(args.filename, args.jobs)):
+			run_metrics.file_done(f, failed=error is not None)
+			if error is not None:
+				print(error, file=sys.stderr)
+				failed += 1
+			else:
+				aggregate.merge(total, stats)
+		engine_data = run_metrics.engine_data = parser.parse_engine_data(args.allods_data_directory, args.filename)
+		with run_metrics.stage('output'):
+			aggregate.write_rows(aggregate.aggregate_rows(total, engine_data), args.aggregate, sys.stdout)
+		if failed:
+			print(f'{failed} of {len(args.filename)} maps could not be read', file=sys.stderr)
+			sys.exit(1)
+		return
+
+	if args.transform:
+		import transform
+
+		if not (args.save or args.in_place or args.dry_run):
+			arg_parser.error('--transform needs --save, --in_place or --dry_run')
+
+		total = collections.Counter()
+		failed = 0
+		results = transform.transform_files(args.filename, args.transform, args.save, args.dry_run, args.jobs)
+		for f, changes, error in run_metrics.each_file(results, 'transform'):
+			run_metrics.file_done(f, failed=error is not None)
+			if error is not None:
+				print(error, file=sys.stderr)
+				failed += 1
+				continue
+			total.update(changes)
+			summary = ', '.join(f'{field}: {count}' for field, count in sorted(changes.items())) or 'no changes'
+			print(f'{f}: {summary}', file=sys.stderr)
+
+		verb = 'would change' if args.dry_run else 'changed'
+		print(f'{verb} {sum(total.values())} fields in {len(args.filename) - failed} maps', file=sys.stderr)
+		if failed:
+			print(f'{failed} of {len(args.filename)} maps failed', file=sys.stderr)
+			sys.exit(1)
+		return
+
+	if args.paste_region:
+		import region
+
+		if not (args.save or args.in_place or args.dry_run):
+			arg_parser.error('--paste_region needs --save, --in_place or --dry_run')
+		if not args.box:
+			arg_parser.error('--paste_region needs --box')
+
+		try:
+			box = region.parse_box(args.box)
+			x, y = (int(v) for v in args.at.split(',')) if args.at else (box.x, box.y)
+			piece = region.copy_region(load_map(args.paste_region), box)
+		except (region.RegionException, parser.ParseException, ValueError) as error:
+			arg_parser.error(common.error_message(error))
+
+		failed = 0
+		results = region.paste_files(args.filename, piece, x, y, args.save, args.dry_run, args.jobs)
+		for f, pasted, error in run_metrics.each_file(results, 'paste'):
+			run_metrics.file_done(f, failed=error is not None)
+			if error is not None:
+				print(error, file=sys.stderr)
+				failed += 1
+				continue
+			summary = ', '.join(f'{kind}: {count}' for kind, count in sorted(pasted.items()) if count) or 'terrain only'
+			print(f'{f}: {summary}', file=sys.stderr)
+		if failed:
+			print(f'{failed} of {len(args.filename)} maps failed', file=sys.stderr)
+			sys.exit(1)
+		return
+
+	if args.minimap:
+		import minimap
+
+		overlays = [o for o in args.minimap_overlays.split(',') if o]
+		unknown = set(overlays) - set(minimap.overlay_colors)
+		if unknown:
+			arg_parser.error(f'unknown minimap overlays: {", ".join(sorted(unknown))}')
+
+		rendered = up_to_date = failed = 0
+		results = minimap.render_files(args.filename, args.minimap, overlays, args.minimap_scale, args.jobs)
+		for f, target, fresh, error in run_metrics.each_file(results, 'render'):
+			run_metrics.file_done(f, failed=error is not None)
+			if error is not None:
+				print(error, file=sys.stderr)
+				failed += 1
+			elif fresh:
+				rendered += 1
+			else:
+				up_to_date += 1
+		run_metrics.cache('minimap', up_to_date, rendered)
+		print(f'{rendered} minimaps rendered, {up_to_date} up to date, {failed} failed', file=sys.stderr)
+		if failed:
+			sys.exit(1)
+		return
+
+	if args.output_format == 'jsonl' and not args.save:
+		import jsonl
+
+		for f in args.filename:
+			with run_metrics.file(f):
+				with run_metrics.stage('parse'):
+					lines = jsonl.file_lines(f, load_map)
+				# Binary maps are decoded as the lines are written.
+				with run_metrics.stage('output'):
+					jsonl.write_lines(lines, sys.stdout)
+		return
+
+	if args.reachability:
+		import reachability
+
+		for f in args.filename:
+			with run_metrics.file(f):
+				with run_metrics.stage('parse'):
+					map_info = load_map(f, lazy=True)
+				with run_metrics.stage('analyze'):
+					print(f'{f}: {map_info.info.map_name}')
+					reachability.report(map_info, lambda line: print('  ' + line))
+		return
+
+	engine_data = run_metrics.engine_data = parser.parse_engine_data(args.allods_data_directory, args.filename)
+
+	if args.unit_table:
+		import unit_table
+
+		table = unit_table.build_table(engine_data.unit_kinds, args.unit_filter)
+		if args.unit_table == 'bin':
+			unit_table.write_binary(table, sys.stdout.buffer)
+		elif args.unit_table == 'jsonl':
+			unit_table.write_jsonl(table, sys.stdout)
+		else:
+			unit_table.write_csv(table, sys.stdout)
+		return
 
 	if args.monsters:
 		select_units = [unit for unit in engine_data.unit_kinds.values() if args.monsters in unit.name]
@@ -457,20 +799,24 @@ def main():
 				print(f'{unit.name} items: {nl}{nl.join(unit.items)}')
 		return
 
-	if args.drops_potions:
-		for unit in engine_data.unit_kinds.values():
-			if unit.kingdom == 62 and unit.drop_mask & 0x4000000 and unit.drop_price_min < unit.drop_price_max:
-				if args.drops == -1 or unit.drop_price_min <= args.drops <= unit.drop_price_max:
-					print(f'Unit {unit.name} can drop books/potions. Range: {unit.drop_price_min}--{unit.drop_price_max}')
+	if args.drops_potions is not None:
+		args.drops = args.drops_potions
+		args.drop_mask = None
+
+	if args.drops is not None:
+		import engine_index
+
+		if args.drop_mask is None:
+			args.drop_mask = engine_index.potions_mask
+		price = None if args.drops == -1 else args.drops
+		what = 'books/potions' if args.drop_mask == engine_index.potions_mask else f'items of mask {a2data.Hex(args.drop_mask)}'
+		for unit in engine_data.droppers(args.drop_mask, price):
+			print(f'Unit {unit.name} can drop {what}. Range: {unit.drop_price_min}--{unit.drop_price_max}')
 		return
 
 	if args.has_magic:
-		units = []
-		for unit in engine_data.unit_kinds.values():
-			if unit.known_spells != 4294967295 and unit.known_spells & (1 << args.has_magic):
-				units.append(unit.name)
-			elif unit.kingdom == 62 and args.has_magic in (unit.spell_1, unit.spell_2, unit.spell_3):
-				units.append(unit.name + ' (ability)')
+		known, ability = engine_data.spell_casters(args.has_magic)
+		units = [unit.name for unit in known] + [unit.name + ' (ability)' for unit in ability]
 
 		print(f'Mobs that know {spell(engine_data, args.has_magic, 0)}: {", ".join(units)}')
 		return
@@ -482,7 +828,12 @@ def main():
 			return
 
 	for f in args.filename:
-		process_file(f, engine_data, args)
+		with run_metrics.file(f):
+			with run_metrics.stage('parse'):
+				map_info = load_map(f, lazy=args.output_format == 'text' and not args.save)
+			# Game data is loaded here, when a report first needs it.
+			with run_metrics.stage('output'):
+				process_file(f, engine_data, args, map_info)
 
 
 if __name__ == '__main__':
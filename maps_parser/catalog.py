@@ -0,0 +1,114 @@
+import csv
+import json
+import os
+
+import a2data
+import common
+import compression
+import parser
+
+
+catalog_size = a2data.Header.size() + a2data.SectionHeader.size() + a2data.GenericInfo.size()
+
+columns = [
+	'file',
+	'map_name',
+	'map_level',
+	'width',
+	'height',
+	'recommended_players',
+	'num_players',
+	'num_buildings',
+	'num_units',
+	'num_logic',
+	'num_bags',
+	'num_groups',
+	'num_inns',
+	'num_shops',
+	'num_signs',
+	'num_music',
+	'author_name',
+]
+
+
+class InfoParser(parser.GenericParser):
+	def parse(self) -> a2data.GenericInfo:
+		if len(self.data) < catalog_size:
+			raise parser.ParseException(f'file is too short for a map header: {len(self.data)} < {catalog_size}')
+
+		header = self.eat(a2data.Header())
+		if header.signature != a2data.alm_signature:
+			raise parser.ParseException(f'incorrect signature: {header.signature}')
+		if header.version != a2data.alm_version:
+			raise parser.ParseException(f'unhandled version: {header.version} != {a2data.alm_version}')
+
+		section_header = self.eat(a2data.SectionHeader())
+		if section_header.id != 0:
+			raise parser.ParseException(f'first section is not generic info: id={section_header.id}')
+
+		return self.eat(a2data.GenericInfo())
+
+
+def read_info(f) -> a2data.GenericInfo:
+	try:
+		# Only the start of a compressed map is decompressed.
+		with compression.open_file(f) as inf:
+			data = inf.read(catalog_size)
+		return InfoParser(data).parse()
+	except Exception as error:
+		raise parser.ParseException(f'failed to read map info from {f!r}') from error
+
+
+def catalog_row(f):
+	# Returns (row, None), or (None, error message) for a file that is not a readable map.
+	try:
+		info = read_info(f)
+	except (parser.ParseException, OSError) as error:
+		return None, common.error_message(error)
+	row = {'file': f}
+	for column in columns[1:]:
+		row[column] = getattr(info, column)
+	return row, None
+
+
+def catalog_rows(filenames, jobs=1):
+	# Yields (file, row, error) in the order of `filenames` as the files are read.
+	if jobs <= 1:
+		for f in filenames:
+			yield (f, *catalog_row(f))
+		return
+
+	import concurrent.futures
+	with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+		for f, (row, error) in zip(filenames, executor.map(catalog_row, filenames)):
+			yield f, row, error
+
+
+def build_catalog(filenames, jobs=1):
+	# Rows of the readable maps only.
+	return [row for f, row, error in catalog_rows(filenames, jobs) if row is not None]
+
+
+def write_catalog(rows, output_format, out):
+	if output_format == 'json':
+		json.dump(rows, out, indent=4, ensure_ascii=False)
+		out.write('\n')
+		return
+
+	delimiter = '\t' if output_format == 'tsv' else ','
+	writer = csv.DictWriter(out, fieldnames=columns, delimiter=delimiter, lineterminator='\n')
+	writer.writeheader()
+	writer.writerows(rows)
+
+
+def find_maps(paths):
+	for path in paths:
+		if not os.path.isdir(path):
+			yield path
+			continue
+
+		for root, dirs, files in os.walk(path):
+			dirs.sort()
+			for name in sorted(files):
+				if compression.base_name(name).lower().endswith('.alm'):
+					yield os.path.join(root, name)
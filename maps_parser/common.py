@@ -0,0 +1,49 @@
+import os
+
+import compression
+
+
+# Names of the map sections by their id, as used in reports and stored revisions.
+section_names = ['info', 'tiles', 'heights', 'objects', 'buildings', 'players', 'units', 'logic', 'bags', 'effects', 'groups', 'shops', 'music']
+
+# Names available to user expressions (`--transform`, `--unit_filter`) besides their own fields.
+expression_builtins = {
+	'abs': abs,
+	'int': int,
+	'len': len,
+	'max': max,
+	'min': min,
+	'round': round,
+}
+
+
+def section_name(section_id):
+	return section_names[section_id] if section_id < len(section_names) else f'section_{section_id}'
+
+
+def error_message(error):
+	# "failed to parse 'x.alm': unexpected end of data ...": the message of `error` followed by
+	# those of the exceptions it was raised from.
+	messages = []
+	while error is not None:
+		messages.append(str(error) or error.__class__.__name__)
+		error = error.__cause__
+	return ': '.join(messages)
+
+
+def output_paths(filenames, output_directory):
+	# file -> where its output goes in `output_directory`: the path relative to the deepest
+	# directory all the files are in, so maps with the same name in different directories
+	# do not overwrite each other.
+	if not filenames:
+		return {}
+	root = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in filenames])
+	return {f: os.path.join(output_directory, os.path.relpath(os.path.abspath(f), root)) for f in filenames}
+
+
+def write_atomically(filename, content):
+	# Compressed if `filename` has a .gz or .xz extension.
+	temporary = filename + '.tmp'
+	with compression.open_file(temporary, 'wb', like=filename) as outf:
+		outf.write(content)
+	os.replace(temporary, filename)
@@ -0,0 +1,56 @@
+import gzip
+import io
+import lzma
+
+
+# What reading a damaged compressed file may raise.
+errors = (OSError, EOFError, lzma.LZMAError)
+
+
+def _open_gzip(filename, mode):
+	# Neither the file name nor a timestamp go into the header, so the same map always
+	# compresses to the same bytes.
+	raw = open(filename, mode)
+	try:
+		stream = gzip.GzipFile('', mode, fileobj=raw, mtime=0)
+	except BaseException:
+		raw.close()
+		raise
+	# GzipFile closes `myfileobj` when it is closed, as if it had opened the file itself.
+	stream.myfileobj = raw
+	return stream
+
+
+# (extension, magic bytes, opener) of the compressed formats maps may be stored in.
+formats = [
+	('.gz', b'\x1f\x8b', _open_gzip),
+	('.xz', b'\xfd7zXZ\x00', lzma.LZMAFile),
+]
+
+
+def base_name(filename):
+	# 'map.alm.gz' -> 'map.alm'; other names are returned as they are.
+	for extension, magic, opener in formats:
+		if filename.lower().endswith(extension):
+			return filename[:-len(extension)]
+	return filename
+
+
+def open_file(filename, mode='rb', like=None):
+	# Opens a map for reading or writing ('r' or 'w', binary or text). When reading, compressed
+	# files are recognized by their magic bytes and decompressed as they are read, so reading
+	# only the start of a file only decompresses the start. When writing, the extension of
+	# `like` (by default of `filename` itself) picks the compression.
+	if 'r' in mode:
+		with open(filename, 'rb') as inf:
+			head = inf.read(max(len(magic) for extension, magic, opener in formats))
+		opener = next((opener for extension, magic, opener in formats if head.startswith(magic)), None)
+	else:
+		name = (like or filename).lower()
+		opener = next((opener for extension, magic, opener in formats if name.endswith(extension)), None)
+
+	if opener is None:
+		return open(filename, mode)
+
+	stream = opener(filename, mode.replace('t', '').replace('b', '') + 'b')
+	return stream if 'b' in mode else io.TextIOWrapper(stream)
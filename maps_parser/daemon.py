@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+import argparse
+import collections
+import http.server
+import io
+import json
+import os
+import re
+import socketserver
+import sys
+import threading
+import urllib.parse
+
+import alm_parser
+import catalog
+import engine_index
+import parser
+
+
+class MapCache:
+	# Bounded LRU of parsed maps keyed by path. An entry is reparsed when the file's
+	# modification time or size changes.
+	def __init__(self, size):
+		self.size = size
+		self.maps = collections.OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, fname):
+		fname = os.path.abspath(fname)
+		stat = os.stat(fname)
+		stamp = (stat.st_mtime_ns, stat.st_size)
+
+		with self.lock:
+			entry = self.maps.get(fname)
+			if entry and entry[0] == stamp:
+				self.maps.move_to_end(fname)
+				self.hits += 1
+				return entry[1]
+			self.misses += 1
+
+		allods_map = alm_parser.load_map(fname)
+
+		with self.lock:
+			self.maps[fname] = (stamp, allods_map)
+			self.maps.move_to_end(fname)
+			while len(self.maps) > self.size:
+				self.maps.popitem(last=False)
+		return allods_map
+
+
+class RequestError(Exception):
+	def __init__(self, status, message):
+		super().__init__(message)
+		self.status = status
+
+
+class Service:
+	def __init__(self, engine_data: parser.EngineData, cache_size, root=None):
+		self.engine_data = engine_data
+		self.cache = MapCache(cache_size)
+		# Symbolic links are resolved on both sides, so a link under the root cannot lead out of it.
+		self.root = os.path.realpath(root) if root else None
+
+	def _files(self, query):
+		files = query.get('file')
+		if not files:
+			raise RequestError(400, 'missing file parameter')
+		for f in files:
+			self._check_root(f)
+			if not os.path.exists(f):
+				raise RequestError(404, f'{f} does not exist')
+		return files
+
+	def _check_root(self, f):
+		if self.root and os.path.commonpath([self.root, os.path.realpath(f)]) != self.root:
+			raise RequestError(403, f'{f} is outside of {self.root}')
+
+	def _flag(self, query, name):
+		return query.get(name, ['0'])[0] not in ('0', '', 'false')
+
+	def _int(self, query, name, default=None):
+		value = query.get(name, [None])[0]
+		if value is None:
+			if default is None:
+				raise RequestError(400, f'missing {name} parameter')
+			return default
+		try:
+			return int(value, 0)
+		except ValueError:
+			raise RequestError(400, f'{name} must be an integer: {value!r}')
+
+	def report(self, query):
+		f = self._files(query)[0]
+		args = argparse.Namespace(
+			rename=False,
+			units=self._flag(query, 'units'),
+			effects=self._flag(query, 'effects'),
+			wields=self._flag(query, 'wields'),
+			level=query.get('level', [None])[0],
+		)
+		text = alm_parser.process_file_internal(f, self.engine_data, self.cache.get(f), args) or ''
+		if not self._flag(query, 'color'):
+			text = re.sub(r'\x1b\[[0-9;]*m', '', text)
+		return 'text/plain', text
+
+	def json(self, query):
+		f = self._files(query)[0]
+		return 'application/json', json.dumps(self.cache.get(f), indent=4, ensure_ascii=False, cls=alm_parser.JsonEncoder)
+
+	def catalog(self, query):
+		output_format = query.get('format', ['tsv'])[0]
+		if output_format not in ('tsv', 'csv', 'json'):
+			raise RequestError(400, f'unknown catalog format {output_format!r}')
+
+		out = io.StringIO()
+		files = list(catalog.find_maps(self._files(query)))
+		# Maps found in a directory under the root may be links to elsewhere.
+		for f in files:
+			self._check_root(f)
+		rows = catalog.build_catalog(files)
+		catalog.write_catalog(rows, output_format, out)
+		return 'application/json' if output_format == 'json' else 'text/plain', out.getvalue()
+
+	def has_magic(self, query):
+		known, ability = self.engine_data.spell_casters(self._int(query, 'spell'))
+		units = [{'name': unit.name, 'ability': False} for unit in known] + [{'name': unit.name, 'ability': True} for unit in ability]
+		return 'application/json', json.dumps(units, ensure_ascii=False)
+
+	def drops(self, query):
+		price = self._int(query, 'price', -1)
+		units = self.engine_data.droppers(self._int(query, 'mask', engine_index.potions_mask), None if price == -1 else price)
+		return 'application/json', json.dumps([
+			{'name': unit.name, 'drop_price_min': unit.drop_price_min, 'drop_price_max': unit.drop_price_max}
+			for unit in units
+		], ensure_ascii=False)
+
+	def stats(self, query):
+		return 'application/json', json.dumps({
+			'cached_maps': len(self.cache.maps),
+			'cache_hits': self.cache.hits,
+			'cache_misses': self.cache.misses,
+		})
+
+	routes = {
+		'/report': report,
+		'/json': json,
+		'/catalog': catalog,
+		'/has_magic': has_magic,
+		'/drops': drops,
+		'/stats': stats,
+	}
+
+	def handle(self, path):
+		url = urllib.parse.urlsplit(path)
+		route = self.routes.get(url.path)
+		if route is None:
+			raise RequestError(404, f'unknown request {url.path}')
+		return route(self, urllib.parse.parse_qs(url.query))
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+	service = None
+
+	def do_GET(self):
+		try:
+			content_type, body = self.service.handle(self.path)
+			status = 200
+		except RequestError as error:
+			status, content_type, body = error.status, 'text/plain', str(error)
+		except Exception as error:
+			status, content_type, body = 500, 'text/plain', f'{error.__class__.__name__}: {error}'
+
+		data = body.encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def address_string(self):
+		# Unix sockets have no client address.
+		return self.client_address[0] if self.client_address else 'local'
+
+	def log_message(self, format, *args):
+		if self.server.verbose:
+			super().log_message(format, *args)
+
+
+class HttpServer(http.server.ThreadingHTTPServer):
+	verbose = False
+
+
+class UnixHttpServer(socketserver.ThreadingUnixStreamServer):
+	verbose = False
+	daemon_threads = True
+
+	def server_bind(self):
+		if os.path.exists(self.server_address):
+			os.unlink(self.server_address)
+		super().server_bind()
+		self.server_name = 'localhost'
+		self.server_port = 0
+
+
+def make_server(service: Service, port=None, socket_path=None):
+	handler = type('Handler', (RequestHandler,), {'service': service})
+	if socket_path:
+		return UnixHttpServer(socket_path, handler)
+	return HttpServer(('127.0.0.1', port), handler)
+
+
+def main():
+	arg_parser = argparse.ArgumentParser(prog='alm_daemon')
+	arg_parser.add_argument('-d', '--allods_data_directory')
+	arg_parser.add_argument('-p', '--port', type=int, default=8642)
+	arg_parser.add_argument('--socket', help='listen on a Unix socket instead of localhost')
+	arg_parser.add_argument('--cache_size', type=int, default=64)
+	arg_parser.add_argument('--root', help='only serve maps under this directory')
+	arg_parser.add_argument('-v', '--verbose', action='store_true')
+	args = arg_parser.parse_args()
+
+	engine_data = parser.parse_engine_data(args.allods_data_directory, [])
+	server = make_server(Service(engine_data, args.cache_size, args.root), args.port, args.socket)
+	server.verbose = args.verbose
+
+	print(f'serving on {args.socket or f"http://127.0.0.1:{args.port}"}', file=sys.stderr)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,145 @@
+import collections
+import hashlib
+import json
+import os
+
+import common
+import compression
+import parser
+
+
+# Maps with the same hashes of these sections are near-duplicates.
+terrain_sections = ['tiles', 'heights', 'objects']
+
+
+def section_hashes(data):
+	# section name -> sha1 of the raw section body, from the section table only.
+	header, sections = parser.section_table(data)
+	hashes = {}
+	for section_header, start, end in sections:
+		hashes[common.section_name(section_header.id)] = hashlib.sha1(data[start:end]).hexdigest()
+	return hashes
+
+
+def combine(hashes, names=None):
+	digest = hashlib.sha1()
+	for name in sorted(hashes) if names is None else names:
+		digest.update(f'{name}:{hashes.get(name, "")}\n'.encode('utf-8'))
+	return digest.hexdigest()
+
+
+def file_entry(f):
+	try:
+		with compression.open_file(f) as inf:
+			data = inf.read()
+		hashes = section_hashes(data)
+	except Exception as error:
+		return {'error': str(error) or error.__class__.__name__}
+	return {
+		'sections': hashes,
+		'fingerprint': combine(hashes),
+		'terrain': combine(hashes, terrain_sections),
+	}
+
+
+class HashCache:
+	# Entries by absolute path, reused while the file's modification time and size stay the same.
+	def __init__(self, filename=None):
+		self.filename = filename
+		self.entries = {}
+		self.changed = False
+		self.hits = 0
+		self.misses = 0
+		if filename and os.path.exists(filename):
+			with open(filename, 'r') as inf:
+				self.entries = json.load(inf)
+
+	def _stamp(self, f):
+		stat = os.stat(f)
+		return [stat.st_mtime_ns, stat.st_size]
+
+	def get(self, f):
+		entry = self.entries.get(os.path.abspath(f))
+		if entry and entry['stamp'] == self._stamp(f):
+			self.hits += 1
+			return entry
+		self.misses += 1
+		return None
+
+	def put(self, f, entry):
+		self.entries[os.path.abspath(f)] = {'stamp': self._stamp(f), **entry}
+		self.changed = True
+
+	def save(self):
+		if not (self.filename and self.changed):
+			return
+		temporary = self.filename + '.tmp'
+		with open(temporary, 'w') as outf:
+			json.dump(self.entries, outf)
+		os.replace(temporary, self.filename)
+
+
+def _with_cache(entries, computed, cache):
+	# `computed` are the entries of the files missing from the cache, in order.
+	for f, entry in entries.items():
+		if entry is None:
+			entry = next(computed)
+			cache.put(f, entry)
+		yield f, entry
+	cache.save()
+
+
+def hash_files(filenames, cache: HashCache, jobs=1):
+	# Yields (file, entry) for every file once, in the order of `filenames`; the cache is
+	# saved when all files are hashed.
+	entries = {f: cache.get(f) for f in filenames}
+	missing = [f for f, entry in entries.items() if entry is None]
+
+	if jobs <= 1:
+		yield from _with_cache(entries, (file_entry(f) for f in missing), cache)
+		return
+
+	# sha1 releases the GIL, so threads are enough.
+	import concurrent.futures
+	with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+		yield from _with_cache(entries, executor.map(file_entry, missing), cache)
+
+
+def find_duplicates(entries):
+	# Returns (exact, near, errors): exact is a list of lists of identical maps; near is a list
+	# of {'files': [[...], ...], 'differs': [...]} for maps that share the terrain but not the rest,
+	# grouped by fingerprint.
+	errors = {f: entry['error'] for f, entry in entries.items() if 'error' in entry}
+	by_fingerprint = collections.defaultdict(list)
+	for f, entry in entries.items():
+		if 'error' not in entry:
+			by_fingerprint[entry['fingerprint']].append(f)
+
+	exact = [sorted(files) for files in by_fingerprint.values() if len(files) > 1]
+
+	by_terrain = collections.defaultdict(list)
+	for fingerprint, files in by_fingerprint.items():
+		by_terrain[entries[files[0]]['terrain']].append(sorted(files))
+
+	near = []
+	for groups in by_terrain.values():
+		if len(groups) < 2:
+			continue
+		hashes = [entries[files[0]]['sections'] for files in groups]
+		names = sorted(set().union(*hashes), key=lambda n: common.section_names.index(n) if n in common.section_names else len(common.section_names))
+		differs = [n for n in names if len({h.get(n) for h in hashes}) > 1]
+		near.append({'files': sorted(groups), 'differs': differs})
+
+	return sorted(exact), sorted(near, key=lambda n: n['files']), errors
+
+
+def format_report(exact, near, errors):
+	lines = []
+	for files in exact:
+		lines.append(f'identical: {", ".join(files)}')
+	for n in near:
+		variants = ' | '.join(', '.join(files) for files in n['files'])
+		lines.append(f'same terrain, different {", ".join(n["differs"])}: {variants}')
+	for f, error in sorted(errors.items()):
+		lines.append(f'{f}: {error}')
+	return ''.join(line + '\n' for line in lines)
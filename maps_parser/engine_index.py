@@ -0,0 +1,80 @@
+import bisect
+import collections
+
+
+all_spells = 0xFFFFFFFF
+monster_kingdom = 62
+
+# drop_mask category that covers books and potions.
+potions_mask = 0x4000000
+
+
+class SpellIndex:
+	# spell id -> unit kinds that know the spell (known_spells bit) or cast it as an ability (spell_1..3).
+	def __init__(self, unit_kinds):
+		self.known = collections.defaultdict(list)
+		self.ability = collections.defaultdict(list)
+
+		for unit in unit_kinds.values():
+			known = set()
+			if unit.known_spells != all_spells:
+				known = {bit for bit in range(32) if unit.known_spells & (1 << bit)}
+				for spell_id in sorted(known):
+					self.known[spell_id].append(unit)
+
+			if unit.kingdom == monster_kingdom:
+				for spell_id in sorted({unit.spell_1, unit.spell_2, unit.spell_3} - known - {0}):
+					self.ability[spell_id].append(unit)
+
+	def casters(self, spell_id):
+		return self.known.get(spell_id, []), self.ability.get(spell_id, [])
+
+
+class PriceIndex:
+	# Static interval index: the price axis is cut into segments at every range boundary and
+	# each segment keeps the units whose [drop_price_min, drop_price_max] covers it.
+	def __init__(self, units):
+		self.units = list(units)
+
+		bounds = set()
+		for unit in self.units:
+			bounds.add(unit.drop_price_min)
+			bounds.add(unit.drop_price_max + 1)
+		self.bounds = sorted(bounds)
+
+		self.segments = [[] for _ in self.bounds]
+		for unit in self.units:
+			first = bisect.bisect_left(self.bounds, unit.drop_price_min)
+			last = bisect.bisect_left(self.bounds, unit.drop_price_max + 1)
+			for i in range(first, last):
+				self.segments[i].append(unit)
+
+	def covering(self, price):
+		i = bisect.bisect_right(self.bounds, price) - 1
+		if i < 0:
+			return []
+		return self.segments[i]
+
+
+class DropIndex:
+	# drop_mask bit -> PriceIndex over the monsters that drop items of that category.
+	def __init__(self, unit_kinds):
+		by_bit = collections.defaultdict(list)
+		for unit in unit_kinds.values():
+			if unit.kingdom != monster_kingdom or unit.drop_price_min >= unit.drop_price_max:
+				continue
+			for bit in range(32):
+				if unit.drop_mask & (1 << bit):
+					by_bit[bit].append(unit)
+
+		self.order = {id(unit): i for i, unit in enumerate(unit_kinds.values())}
+		self.by_bit = {bit: PriceIndex(units) for bit, units in by_bit.items()}
+
+	def droppers(self, mask, price=None):
+		found = {}
+		for bit, index in self.by_bit.items():
+			if not mask & (1 << bit):
+				continue
+			for unit in index.units if price is None else index.covering(price):
+				found[id(unit)] = unit
+		return sorted(found.values(), key=lambda unit: self.order[id(unit)])
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import random
+import sys
+
+import a2data
+import marshaller
+import parser
+
+
+# Every key of a spec, with its default. Counts are totals for the map; `*_per_*` are maxima.
+default_spec = {
+	'name': 'Load test',
+	'seed': 0,
+	'width': 256,
+	'height': 256,
+	'level': 1,
+	'players': 2,
+	'buildings': 0,
+	'units': 1000,
+	'groups': 50,
+	'bags': 500,
+	'items_per_bag': 4,
+	'effects': 100,
+	'modifiers_per_effect': 2,
+	'triggers': 200,
+	'conditions_per_trigger': 2,
+	'actions_per_trigger': 2,
+	'music': 10,
+	'unit_server_ids': [643],
+	'building_type_ids': [19],
+	# Taken from world/data/itemname.bin.
+	'item_ids': [0x0102, 0x0201, 0x0e01, 0x1102, 0x2122, 0x5142],
+	'spell_ids': [1],
+}
+
+# Entities are kept this far from the map edge, which is not playable.
+border = 8
+
+
+class GeneratorException(Exception):
+	pass
+
+
+class Records:
+	# A sized, re-iterable sequence of `count` records made by `factory(rng, i)` on the fly.
+	# Marshaller only needs `len()` and iteration (and `values()` for instances and checks).
+	def __init__(self, seed, kind, count, factory):
+		self.seed = seed
+		self.kind = kind
+		self.count = count
+		self.factory = factory
+
+	def __len__(self):
+		return self.count
+
+	def __iter__(self):
+		rng = random.Random(f'{self.seed}/{self.kind}')
+		for i in range(self.count):
+			yield self.factory(rng, i)
+
+	def values(self):
+		return self
+
+
+def load_spec(spec_file=None, overrides=()):
+	spec = dict(default_spec)
+	if spec_file:
+		with open(spec_file, 'r') as inf:
+			try:
+				values = json.load(inf)
+			except ValueError as error:
+				raise GeneratorException(f'spec {spec_file!r} is not valid JSON: {error}')
+		if not isinstance(values, dict):
+			raise GeneratorException(f'spec {spec_file!r} must be a JSON object')
+		spec.update(values)
+	for override in overrides:
+		key, sep, value = override.partition('=')
+		if not sep:
+			raise GeneratorException(f'override must look like key=value: {override!r}')
+		if key not in default_spec:
+			raise GeneratorException(f'unknown spec key: {key}')
+		if isinstance(default_spec[key], str):
+			spec[key] = value
+			continue
+		try:
+			spec[key] = json.loads(value)
+		except ValueError:
+			raise GeneratorException(f'{key} must be a JSON value, got {value!r}')
+
+	unknown = set(spec) - set(default_spec)
+	if unknown:
+		raise GeneratorException(f'unknown spec keys: {", ".join(sorted(unknown))}')
+	check_types(spec)
+	if not 1 <= spec['players'] <= 16:
+		raise GeneratorException(f'maps have 1-16 players, not {spec["players"]}')
+	if spec['width'] <= 2 * border or spec['height'] <= 2 * border:
+		raise GeneratorException(f'map must be larger than {2 * border}x{2 * border}')
+	if not 1 <= spec['conditions_per_trigger'] <= 3 or not 1 <= spec['actions_per_trigger'] <= 4:
+		raise GeneratorException('triggers have 1-3 conditions and 1-4 actions')
+	if spec['units'] >= 0x10000:
+		raise GeneratorException('unit IDs are 16 bit')
+	return spec
+
+
+def check_types(spec):
+	# Values must be of the type of their default; numbers other than the seed are not negative
+	# and lists of ids are not empty.
+	is_number = lambda v: isinstance(v, int) and not isinstance(v, bool)
+	for key, value in spec.items():
+		default = default_spec[key]
+		if isinstance(default, list):
+			if not isinstance(value, list) or not value or not all(is_number(v) for v in value):
+				raise GeneratorException(f'{key} must be a non-empty list of numbers, got {value!r}')
+		elif isinstance(default, int):
+			if not is_number(value):
+				raise GeneratorException(f'{key} must be a number, got {value!r}')
+			if value < 0 and key != 'seed':
+				raise GeneratorException(f'{key} must not be negative, got {value}')
+		elif not isinstance(value, str):
+			raise GeneratorException(f'{key} must be a string, got {value!r}')
+
+
+def check_ids(spec, engine_data):
+	# Item ids and unit server ids the game data does not have make maps the game cannot load.
+	unknown_items = set(spec['item_ids']) - set(engine_data.item_ids)
+	if unknown_items:
+		raise GeneratorException(f'unknown item ids: {", ".join(hex(i) for i in sorted(unknown_items))}')
+	unknown_units = set(spec['unit_server_ids']) - set(engine_data.unit_kinds)
+	if unknown_units:
+		raise GeneratorException(f'unknown unit server ids: {", ".join(map(str, sorted(unknown_units)))}')
+
+
+def generate_map(spec) -> a2data.AllodsMap:
+	# A map whose lists are `Records`: nothing is generated until it is marshalled.
+	seed, width, height = spec['seed'], spec['width'], spec['height']
+	records = lambda kind, count, factory: Records(seed, kind, count, factory)
+
+	def position(rng):
+		return rng.randrange(border, width - border), rng.randrange(border, height - border)
+
+	def tile(rng, i):
+		# ground or grass, any of the 16 variants
+		return a2data.Hex(rng.randrange(2) << 8 | rng.randrange(16) << 4)
+
+	def player(rng, i):
+		diplomacy = [a2data.Hex(0x10 if j == i else 0x1) if j < spec['players'] else a2data.Hex(0) for j in range(16)]
+		return a2data.Player(color=i, flags=a2data.Hex(1 if i == 0 else 0), money=rng.randrange(10000), name=f'Player {i + 1}', diplomacy=diplomacy)
+
+	def building(rng, i):
+		x, y = position(rng)
+		return a2data.Building(x=x, y=y, type_id=rng.choice(spec['building_type_ids']), health=100, player=rng.randrange(spec['players']) + 1, building_id=i + 1)
+
+	def unit(rng, i):
+		x, y = position(rng)
+		return a2data.Unit(
+			x=x, y=y, type_id=0, face=0, flags=a2data.Hex(0), more_flags=a2data.Hex(0),
+			server_id=rng.choice(spec['unit_server_ids']),
+			player_id=rng.randrange(spec['players']) + 1,
+			bag_id=i + 1 if i < spec['bags'] else 0,
+			rotation=rng.randrange(16), hp=65535, max_hp=65535, unit_id=i + 1, something_3=a2data.Hex(0),
+			group_id=rng.randrange(spec['groups']) + 1 if spec['groups'] else 0,
+		)
+
+	def bag(rng, i):
+		x, y = position(rng)
+		items = [
+			a2data.BagItem(
+				item_id=a2data.Hex(rng.choice(spec['item_ids'])),
+				wielded=rng.randrange(2),
+				effect=rng.randrange(spec['effects'] + 1),
+			)
+			for j in range(rng.randrange(spec['items_per_bag'] + 1))
+		]
+		return a2data.Bag(num_items=len(items), unit_id=i + 1 if i < spec['units'] else 0, x=x, y=y, gold=rng.randrange(1000), items=items)
+
+	def effect(rng, i):
+		modifiers = [a2data.EffectModifier(x=rng.randrange(1, 40), y=rng.randrange(1, 10), flags=0) for j in range(rng.randrange(spec['modifiers_per_effect'] + 1))]
+		return a2data.Effect(
+			range=0, x=0, y=0, magic_type=0, min_magic_damage=0, max_magic_damage=0,
+			spell_type_id=rng.choice(spec['spell_ids']), spell_power=rng.randrange(1, 6),
+			num_modifiers=len(modifiers), modifiers=modifiers,
+		)
+
+	def group(rng, i):
+		return a2data.Group(group_id=i + 1, repop_time=rng.choice([0, 300, 600]), flags=a2data.Hex(0), instance_id=0)
+
+	# Trigger i compares variable(i) with a constant in every condition and changes the
+	# variable in every action. Trigger i uses checks and instances from i * per_trigger + 1.
+	checks_per_trigger = 2 * spec['conditions_per_trigger']
+
+	def check(rng, i):
+		arg_value = [i // checks_per_trigger, 0] + [0] * 8 if i % 2 == 0 else [rng.randrange(100)] + [0] * 9
+		return a2data.Instance(
+			name=f'check {i + 1}', type_id=19 if i % 2 == 0 else 65538, index=i + 1, execute_once=0,
+			arg_value=arg_value, arg_type=[0] * 10, arg_name=[''] * 10,
+		)
+
+	def instance(rng, i):
+		variable = i // spec['actions_per_trigger']
+		type_id = rng.choice([3, 8])
+		return a2data.Instance(
+			name=f'action {i + 1}', type_id=type_id, index=i + 1, execute_once=0,
+			arg_value=[variable, rng.randrange(100)] + [0] * 8, arg_type=[0] * 10, arg_name=[''] * 10,
+		)
+
+	def trigger(rng, i):
+		check_ids = [i * checks_per_trigger + j + 1 for j in range(checks_per_trigger)]
+		instance_ids = [i * spec['actions_per_trigger'] + j + 1 for j in range(spec['actions_per_trigger'])]
+		return a2data.Trigger(
+			name=f'trigger {i + 1}',
+			check_ids=check_ids + [0] * (6 - len(check_ids)),
+			instance_ids=instance_ids + [0] * (4 - len(instance_ids)),
+			check_operators=[rng.randrange(6) for j in range(3)],
+			execute_once=rng.randrange(2),
+		)
+
+	def music(rng, i):
+		x, y = position(rng)
+		return a2data.Music(x=x, y=y, radius=rng.randrange(5, 30), melody_type_id=[rng.randrange(1, 20), 0, 0, 0])
+
+	info = a2data.GenericInfo(
+		width=width, height=height, sun_angle=0, time_of_day=0, darkness=0, contrast=0, use_tiles=0,
+		num_players=0, num_buildings=0, num_units=0, num_logic=0, num_bags=0, num_groups=0,
+		num_inns=0, num_shops=0, num_signs=0, num_music=0,
+		map_name=spec['name'], recommended_players=spec['players'], map_level=spec['level'],
+		something_1=0, something_2=0, author_name='generate.py',
+	)
+	return a2data.AllodsMap(
+		info,
+		records('tiles', width * height, tile),
+		records('heights', width * height, lambda rng, i: 0),
+		records('objects', width * height, lambda rng, i: 0),
+		records('units', spec['units'], unit),
+		records('buildings', spec['buildings'], building),
+		records('players', spec['players'], player),
+		records('instances', spec['triggers'] * spec['actions_per_trigger'], instance),
+		records('checks', spec['triggers'] * checks_per_trigger, check),
+		records('triggers', spec['triggers'], trigger),
+		records('bags', spec['bags'], bag),
+		records('effects', spec['effects'], effect),
+		records('groups', spec['groups'], group),
+		records('inns', 0, None),
+		records('shops', 0, None),
+		records('signs', 0, None),
+		# The music section holds one more entry than info.num_music.
+		records('music', spec['music'] + 1, music),
+	)
+
+
+def write_map(spec, filename):
+	with open(filename, 'wb') as outf:
+		marshaller.Marshaller(generate_map(spec)).write_to(outf)
+
+
+def verify_map(spec, filename):
+	# Parses the file and checks that the counts match the spec and that it marshals back
+	# to the same bytes.
+	with open(filename, 'rb') as inf:
+		data = inf.read()
+	allods_map = parser.Parser(data).parse()
+
+	expected = {
+		'units': spec['units'],
+		'buildings': spec['buildings'],
+		'players': spec['players'],
+		'bags': spec['bags'],
+		'effects': spec['effects'],
+		'groups': spec['groups'],
+		'triggers': spec['triggers'],
+		'music': spec['music'] + 1,
+	}
+	for kind, count in expected.items():
+		if len(getattr(allods_map, kind)) != count:
+			raise GeneratorException(f'{filename}: {kind}: expected {count}, parsed {len(getattr(allods_map, kind))}')
+
+	if marshaller.Marshaller(allods_map).marshal() != data:
+		raise GeneratorException(f'{filename}: does not marshal back to the same bytes')
+
+
+def main():
+	arg_parser = argparse.ArgumentParser(prog='alm_generate', description='Generate synthetic maps for load testing.')
+	arg_parser.add_argument('output', nargs='+', help='one map per file; seeds are seed, seed + 1, ...')
+	arg_parser.add_argument('--spec', help='JSON file with any of: ' + ', '.join(default_spec))
+	arg_parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help='override a spec key')
+	arg_parser.add_argument('--no_verify', action='store_true', help='do not parse the maps back')
+	arg_parser.add_argument('-d', '--allods_data_directory', help='check item and unit ids against the game data')
+	args = arg_parser.parse_args()
+
+	try:
+		spec = load_spec(args.spec, args.set)
+		if args.allods_data_directory:
+			check_ids(spec, parser.EngineData(args.allods_data_directory))
+	except GeneratorException as error:
+		arg_parser.error(str(error))
+
+	for i, filename in enumerate(args.output):
+		map_spec = dict(spec, seed=spec['seed'] + i)
+		write_map(map_spec, filename)
+		if not args.no_verify:
+			verify_map(map_spec, filename)
+		print(f'{filename}: seed {map_spec["seed"]}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+	main()
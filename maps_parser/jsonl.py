@@ -0,0 +1,55 @@
+import json
+
+import a2data
+import compression
+import parser
+
+
+# Grid cells ('tile', 'height', 'object') and the file structure events are not exported.
+skipped_events = {'header', 'section', 'end', 'tile', 'height', 'object'}
+
+
+def map_events(allods_map: a2data.AllodsMap):
+	# The same (kind, record) pairs as parser.Parser.events(), for maps loaded from JSON.
+	yield 'info', allods_map.info
+	for kind, records in (('building', allods_map.buildings), ('player', allods_map.players), ('unit', allods_map.units),
+			('instance', allods_map.instances.values()), ('check', allods_map.checks.values()), ('trigger', allods_map.triggers),
+			('bag', allods_map.bags), ('effect', allods_map.effects), ('group', allods_map.groups), ('inn', allods_map.inns),
+			('shop', allods_map.shops), ('sign', allods_map.signs), ('music', allods_map.music)):
+		for record in records:
+			yield kind, record
+
+
+def record_lines(fname, events):
+	# One dict per record, tagged with the file and record kind. Bags and effects are numbered
+	# from 1 as `bag_id` / `effect_id`, which is what `Unit.bag_id` and `BagItem.effect` refer to;
+	# their items and modifiers become separate records carrying that id.
+	counts = {'bag': 0, 'effect': 0}
+	for kind, record in events:
+		if kind in skipped_events:
+			continue
+
+		fields = {k: v for k, v in record.__dict__.items() if k not in ('items', 'modifiers')}
+		if kind == 'bag':
+			counts[kind] += 1
+			yield {'file': fname, 'record': kind, 'bag_id': counts[kind], **fields}
+			for i, item in enumerate(record.items):
+				yield {'file': fname, 'record': 'bag_item', 'bag_id': counts[kind], 'item_index': i, **item.__dict__}
+		elif kind == 'effect':
+			counts[kind] += 1
+			yield {'file': fname, 'record': kind, 'effect_id': counts[kind], **fields}
+			for i, modifier in enumerate(record.modifiers):
+				yield {'file': fname, 'record': 'effect_modifier', 'effect_id': counts[kind], 'modifier_index': i, **modifier.__dict__}
+		else:
+			yield {'file': fname, 'record': kind, **fields}
+
+
+def file_lines(fname, load_map):
+	if compression.base_name(fname).endswith('.json'):
+		return record_lines(fname, map_events(load_map(fname)))
+	return record_lines(fname, parser.parse_events(fname))
+
+
+def write_lines(lines, out):
+	for line in lines:
+		out.write(json.dumps(line, ensure_ascii=False) + '\n')
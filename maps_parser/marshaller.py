@@ -1,22 +1,28 @@
 import io
+import itertools
 import struct
 
 import a2data
+import compression
 
 
 header_size = a2data.SectionHeader.size()
 
+# Grid layers are packed this many cells at a time.
+grid_chunk = 4096
+
 
 class Marshaller():
-	def __init__(self, allods_map: a2data.AllodsMap):
-		self.buffer = io.BytesIO()
+	# Every section is encoded into its own buffer and the buffers are written in file order.
+	# The map is only read, never modified, so several threads may marshal the same map; with
+	# `jobs` > 1 the sections themselves are encoded on a thread pool.
+	def __init__(self, allods_map: a2data.AllodsMap, jobs=1):
 		self.map = allods_map
+		self.jobs = jobs
 
-	def _write(self, value: a2data.Format):
-		fmt_str = value.__class__.as_struct()
-		packed = value.to_packed(value)
-		content = struct.pack(fmt_str, *packed)
-		self.buffer.write(content)
+	@staticmethod
+	def _write(out, value: a2data.Format, **overrides):
+		out.write(value.pack(overrides))
 
 	def _section_header(self, id, section_size):
 		return a2data.SectionHeader(
@@ -28,7 +34,14 @@ class Marshaller():
 		)
 
 	def marshal(self) -> bytes:
-		self._write(a2data.Header(
+		stream = io.BytesIO()
+		self.write_to(stream)
+		return stream.getvalue()
+
+	def write_to(self, stream):
+		# Writes the map to a stream, which does not have to be seekable. Records are written as
+		# the map's lists are iterated, so these may be any sized iterables, not necessarily lists.
+		self._write(stream, a2data.Header(
 			signature = a2data.alm_signature,
 			alm_size = 20,
 			something_0 = 0,
@@ -36,120 +49,131 @@ class Marshaller():
 			version = a2data.alm_version,
 		))
 
-		self._section(0, self._info_section)
-		self._section(1, self._landscape_section)
-		self._section(2, self._heights_section)
-		self._section(3, self._objects_section)
-		self._section(5, self._players_section)
-		self._section(11, self._shops_section)
-		self._section(4, self._bridges_section)
-		self._section(9, self._effects_section)
-		self._section(8, self._bags_section)
-		self._section(6, self._units_section)
-		self._section(7, self._logics_section)
-		self._section(10, self._groups_section)
-		self._section(12, self._music_section)
-
-		return self.buffer.getvalue()
-	
-	def _section(self, id, wrapped_implementation):
-		start = self.buffer.tell()
-		self._write(self._section_header(id, 0))
-
-		wrapped_implementation()
-
-		end = self.buffer.tell()
-		self.buffer.seek(start)
-		self._write(self._section_header(id, end - start - header_size))
-		self.buffer.seek(end)
-		assert self.buffer.tell() == end
-
-	def _info_section(self):
-		self.map.info.num_players = len(self.map.players)
-		self.map.info.num_buildings = len(self.map.buildings)
-		self.map.info.num_units = len(self.map.units)
-		self.map.info.num_logic = len(self.map.instances) + len(self.map.checks) + len(self.map.triggers)
-		self.map.info.num_bags = len(self.map.bags)
-		self.map.info.num_groups = len(self.map.groups)
-		self.map.info.num_inns = len(self.map.inns)
-		self.map.info.num_shops = len(self.map.shops)
-		self.map.info.num_signs = len(self.map.signs)
-		self.map.info.num_music = len(self.map.music) - 1
-		
-		self._write(self.map.info)
-
-	def _landscape_section(self):
-		for t in self.map.tiles:
-			self._write(a2data.Landscape(tile=t))
-
-	def _heights_section(self):
-		for h in self.map.heights:
-			self._write(a2data.Height(height=h))
-
-	def _objects_section(self):
-		for o in self.map.objects:
-			self._write(a2data.Object(object_id=o))
-
-	def _bridges_section(self):
+		sections = [
+			(0, self._info_section),
+			(1, self._landscape_section),
+			(2, self._heights_section),
+			(3, self._objects_section),
+			(5, self._players_section),
+			(11, self._shops_section),
+			(4, self._bridges_section),
+			(9, self._effects_section),
+			(8, self._bags_section),
+			(6, self._units_section),
+			(7, self._logics_section),
+			(10, self._groups_section),
+			(12, self._music_section),
+		]
+
+		if self.jobs <= 1:
+			for id, implementation in sections:
+				stream.write(self._section(id, implementation))
+			return
+
+		import concurrent.futures
+		with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+			for section in executor.map(lambda s: self._section(*s), sections):
+				stream.write(section)
+
+	def _section(self, id, implementation) -> bytes:
+		out = io.BytesIO()
+		implementation(out)
+		body = out.getvalue()
+		return self._section_header(id, len(body)).pack() + body
+
+	def _info_section(self, out):
+		# The counts are written as the lists have them; `info` keeps whatever it had.
+		self._write(out, self.map.info,
+			num_players = len(self.map.players),
+			num_buildings = len(self.map.buildings),
+			num_units = len(self.map.units),
+			num_logic = len(self.map.instances) + len(self.map.checks) + len(self.map.triggers),
+			num_bags = len(self.map.bags),
+			num_groups = len(self.map.groups),
+			num_inns = len(self.map.inns),
+			num_shops = len(self.map.shops),
+			num_signs = len(self.map.signs),
+			num_music = len(self.map.music) - 1,
+		)
+
+	def _grid(self, out, record_class, cells):
+		# Grid records have a single field, so a chunk of cells is packed at once.
+		symbol = record_class.as_struct()[1:]
+		cells = iter(cells)
+		while True:
+			chunk = list(itertools.islice(cells, grid_chunk))
+			if not chunk:
+				break
+			out.write(struct.pack(f'<{len(chunk)}{symbol}', *chunk))
+
+	def _landscape_section(self, out):
+		self._grid(out, a2data.Landscape, self.map.tiles)
+
+	def _heights_section(self, out):
+		self._grid(out, a2data.Height, self.map.heights)
+
+	def _objects_section(self, out):
+		self._grid(out, a2data.Object, self.map.objects)
+
+	def _bridges_section(self, out):
 		for building in self.map.buildings:
-			self._write(building)
+			self._write(out, building)
 
 			if building.type_id >= 0x1000000:
-				self._write(a2data.BridgeSize(bridge_width=building.bridge_width, bridge_height=building.bridge_height))
+				self._write(out, a2data.BridgeSize(bridge_width=building.bridge_width, bridge_height=building.bridge_height))
 
-	def _players_section(self):
+	def _players_section(self, out):
 		for p in self.map.players:
-			self._write(p)
+			self._write(out, p)
 
-	def _units_section(self):
+	def _units_section(self, out):
 		for u in self.map.units:
-			self._write(u)
+			self._write(out, u)
 
-	def _logics_section(self):
-		self._write(a2data.Instances(num_instances=len(self.map.instances)))
+	def _logics_section(self, out):
+		self._write(out, a2data.Instances(num_instances=len(self.map.instances)))
 		for i in sorted(self.map.instances.values(), key=lambda inst: inst.index):
-			self._write(i)
+			self._write(out, i)
 
-		self._write(a2data.Instances(num_instances=len(self.map.checks)))
+		self._write(out, a2data.Instances(num_instances=len(self.map.checks)))
 		for c in sorted(self.map.checks.values(), key=lambda check: check.index):
-			self._write(c)
+			self._write(out, c)
 
-		self._write(a2data.Instances(num_instances=len(self.map.triggers)))
+		self._write(out, a2data.Instances(num_instances=len(self.map.triggers)))
 		for t in self.map.triggers:
-			self._write(t)
+			self._write(out, t)
 
-	def _bags_section(self):
+	def _bags_section(self, out):
 		for bag in self.map.bags:
-			bag.num_items = len(bag.items)
-			self._write(bag)
+			self._write(out, bag, num_items=len(bag.items))
 			for item in bag.items:
-				self._write(item)
+				self._write(out, item)
 
-	def _effects_section(self):
-		self._write(a2data.Effects(num_effects=len(self.map.effects)))
+	def _effects_section(self, out):
+		self._write(out, a2data.Effects(num_effects=len(self.map.effects)))
 		for effect in self.map.effects:
-			effect.num_modifiers = len(effect.modifiers)
-			self._write(effect)
+			self._write(out, effect, num_modifiers=len(effect.modifiers))
 			for mod in effect.modifiers:
-				self._write(mod)
+				self._write(out, mod)
 
-	def _groups_section(self):
+	def _groups_section(self, out):
 		for g in self.map.groups:
-			self._write(g)
+			self._write(out, g)
 
-	def _shops_section(self):
+	def _shops_section(self, out):
 		for i in self.map.inns:
-			self._write(i)
+			self._write(out, i)
 		for s in self.map.shops:
-			self._write(s)
+			self._write(out, s)
 		for s in self.map.signs:
-			self._write(s)
+			self._write(out, s)
 
-	def _music_section(self):
+	def _music_section(self, out):
 		for m in self.map.music:
-			self._write(m)
+			self._write(out, m)
 
 
-def marshal(allods_map: a2data.AllodsMap, filename: str):
-	with open(filename, 'wb') as outf:
-		outf.write(Marshaller(allods_map).marshal())
+def marshal(allods_map: a2data.AllodsMap, filename: str, jobs=1):
+	# A .alm.gz or .alm.xz filename writes a compressed map.
+	with compression.open_file(filename, 'wb') as outf:
+		Marshaller(allods_map, jobs).write_to(outf)
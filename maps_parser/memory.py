@@ -0,0 +1,98 @@
+import collections
+import sys
+import tracemalloc
+
+import a2data
+
+
+map_attributes = [k for k, v in a2data.AllodsMap._fields]
+
+
+class SizeCounter:
+	# Deep object sizes via sys.getsizeof. Every object is counted once; the bytes of a record
+	# (its instance, `__dict__` and plain values) go to its class, nested records count for themselves.
+	def __init__(self):
+		self.seen = set()
+		self.records = collections.defaultdict(lambda: {'count': 0, 'bytes': 0})
+
+	def size(self, obj):
+		return self._walk(obj)[0]
+
+	def _walk(self, obj):
+		# Returns (deep size, bytes that are not inside a nested record).
+		if id(obj) in self.seen:
+			return 0, 0
+		self.seen.add(id(obj))
+
+		own = sys.getsizeof(obj)
+		children = ()
+		if isinstance(obj, a2data.Format):
+			own += sys.getsizeof(obj.__dict__)
+			children = list(obj.__dict__.values())
+			# Lazy views also hold the buffer they were read from.
+			if isinstance(obj, a2data.RecordView) and obj._buffer is not None:
+				children.append(obj._buffer)
+		elif isinstance(obj, dict):
+			children = [x for item in obj.items() for x in item]
+		elif isinstance(obj, (list, tuple, set, frozenset)):
+			children = obj
+
+		total = own
+		for child in children:
+			child_total, child_own = self._walk(child)
+			total += child_total
+			own += child_own
+
+		if isinstance(obj, a2data.Format):
+			record = self.records[obj.__class__.__name__]
+			record['count'] += 1
+			record['bytes'] += own
+			return total, 0
+		return total, own
+
+
+def map_sizes(allods_map: a2data.AllodsMap):
+	# Returns ({attribute: bytes}, {record class: {'count', 'bytes'}}).
+	counter = SizeCounter()
+	attributes = {name: counter.size(getattr(allods_map, name)) for name in map_attributes}
+	return attributes, dict(counter.records)
+
+
+def measure(fname, load_map):
+	# Loads one map under tracemalloc: bytes it keeps, peak during loading and the deep sizes.
+	started = not tracemalloc.is_tracing()
+	if started:
+		tracemalloc.start()
+	tracemalloc.reset_peak()
+	before, _ = tracemalloc.get_traced_memory()
+
+	allods_map = load_map(fname)
+	current, peak = tracemalloc.get_traced_memory()
+	attributes, records = map_sizes(allods_map)
+
+	if started:
+		tracemalloc.stop()
+	return {
+		'file': fname,
+		'traced_bytes': current - before,
+		'peak_bytes': peak - before,
+		'attributes': attributes,
+		'records': records,
+	}
+
+
+def summarize(reports):
+	attributes = collections.Counter()
+	records = collections.defaultdict(lambda: {'count': 0, 'bytes': 0})
+	for report in reports:
+		attributes.update(report['attributes'])
+		for name, r in report['records'].items():
+			records[name]['count'] += r['count']
+			records[name]['bytes'] += r['bytes']
+	return {
+		'maps': len(reports),
+		'traced_bytes': sum(r['traced_bytes'] for r in reports),
+		'peak_bytes': max((r['peak_bytes'] for r in reports), default=0),
+		'attributes': dict(attributes),
+		'records': dict(sorted(records.items(), key=lambda item: -item[1]['bytes'])),
+	}
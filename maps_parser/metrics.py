@@ -0,0 +1,167 @@
+import collections
+import contextlib
+import os
+import threading
+import time
+
+
+prefix = 'alm_parser'
+
+
+def _labels(labels):
+	if not labels:
+		return ''
+	escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+	return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def peak_rss():
+	# Peak resident set size in bytes of this process and of its finished children (process pools),
+	# or None where the resource module is missing.
+	try:
+		import resource
+	except ImportError:
+		return None
+	# ru_maxrss is in kilobytes on Linux.
+	return {
+		'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+		'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+	}
+
+
+class Metrics:
+	# Batch run metrics in the Prometheus textfile collector format. Without a filename
+	# everything is still counted but nothing is written.
+	def __init__(self, filename=None, interval=60, mode=''):
+		self.filename = filename
+		self.interval = interval
+		self.mode = mode
+		self.started = time.time()
+		self.finished = False
+		self.succeeded = False
+		self.files_processed = 0
+		self.files_failed = 0
+		self.bytes_read = 0
+		self.stage_seconds = collections.Counter()
+		self.caches = {}
+		self.engine_data = None
+		self.lock = threading.Lock()
+		self.stop = threading.Event()
+		self.thread = None
+
+	@contextlib.contextmanager
+	def stage(self, name):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.stage_seconds[name] += time.perf_counter() - start
+
+	@contextlib.contextmanager
+	def file(self, fname):
+		# Counts a map as processed or failed (the exception is not swallowed).
+		try:
+			yield
+		except BaseException:
+			self.files_failed += 1
+			raise
+		self.file_done(fname)
+
+	def file_done(self, fname, failed=False, bytes_read=None):
+		# Counts a map of a batch as soon as its result is there; by default all of it was read.
+		if failed:
+			self.files_failed += 1
+			return
+		self.files_processed += 1
+		if bytes_read is not None:
+			self.bytes_read += bytes_read
+		elif os.path.exists(fname):
+			self.bytes_read += os.path.getsize(fname)
+
+	def each_file(self, results, stage='parse'):
+		# Iterates over the per-map results of a batch helper. The time spent waiting for them,
+		# which is the time it takes to read them, is counted in `stage`.
+		results = iter(results)
+		while True:
+			with self.stage(stage):
+				try:
+					result = next(results)
+				except StopIteration:
+					return
+			yield result
+
+	def cache(self, name, hits, misses):
+		self.caches[name] = (hits, misses)
+
+	def render(self):
+		lines = []
+
+		def metric(name, kind, help, samples):
+			lines.append(f'# HELP {prefix}_{name} {help}')
+			lines.append(f'# TYPE {prefix}_{name} {kind}')
+			for labels, value in samples:
+				lines.append(f'{prefix}_{name}{_labels(labels)} {value}')
+
+		metric('run_info', 'gauge', 'Mode of the run.', [({'mode': self.mode}, 1)])
+		metric('run_start_timestamp_seconds', 'gauge', 'When the run started.', [({}, f'{self.started:.3f}')])
+		metric('run_finished', 'gauge', '1 once the run has ended.', [({}, int(self.finished))])
+		metric('run_succeeded', 'gauge', '1 if the run has ended without an error.', [({}, int(self.succeeded))])
+		metric('files_processed_total', 'counter', 'Maps processed.', [({}, self.files_processed)])
+		metric('files_failed_total', 'counter', 'Maps that failed.', [({}, self.files_failed)])
+		metric('bytes_read_total', 'counter', 'Bytes of the processed maps.', [({}, self.bytes_read)])
+		metric('run_seconds', 'gauge', 'Time since the run started.', [({}, f'{time.time() - self.started:.3f}')])
+
+		# Game data is loaded when it is first used, so its time is also part of that stage.
+		load_times = dict(getattr(self.engine_data, 'load_times', {}))
+		stages = collections.Counter(self.stage_seconds)
+		if load_times:
+			stages['engine_data'] = sum(load_times.values())
+		metric('stage_seconds_total', 'counter', 'Time spent per stage (engine_data, parse, analyze, output, ...).',
+			[({'stage': name}, f'{seconds:.6f}') for name, seconds in sorted(stages.items())])
+
+		if load_times:
+			metric('engine_data_load_seconds', 'gauge', 'Time to load each part of the game data.',
+				[({'table': name}, f'{seconds:.6f}') for name, seconds in sorted(load_times.items())])
+
+		if self.caches:
+			metric('cache_hits_total', 'counter', 'Cache hits.', [({'cache': name}, hits) for name, (hits, misses) in sorted(self.caches.items())])
+			metric('cache_misses_total', 'counter', 'Cache misses.', [({'cache': name}, misses) for name, (hits, misses) in sorted(self.caches.items())])
+			metric('cache_hit_ratio', 'gauge', 'Share of cache hits.',
+				[({'cache': name}, f'{hits / (hits + misses):.4f}' if hits + misses else 0) for name, (hits, misses) in sorted(self.caches.items())])
+
+		rss = peak_rss()
+		if rss is not None:
+			metric('peak_rss_bytes', 'gauge', 'Peak resident set size.', [({'process': k}, v) for k, v in rss.items()])
+
+		return '\n'.join(lines) + '\n'
+
+	def write(self):
+		if not self.filename:
+			return
+		with self.lock:
+			# The textfile collector must never see a half written file.
+			temporary = f'{self.filename}.{os.getpid()}.tmp'
+			with open(temporary, 'w') as outf:
+				outf.write(self.render())
+			os.replace(temporary, self.filename)
+
+	def start(self):
+		# Rewrites the file every `interval` seconds until `close()`.
+		if not self.filename:
+			return
+		self.write()
+		if self.interval > 0:
+			self.thread = threading.Thread(target=self._run, daemon=True)
+			self.thread.start()
+
+	def _run(self):
+		while not self.stop.wait(self.interval):
+			self.write()
+
+	def close(self, succeeded):
+		self.stop.set()
+		if self.thread is not None:
+			self.thread.join()
+		self.finished = True
+		self.succeeded = succeeded
+		self.write()
@@ -0,0 +1,221 @@
+import concurrent.futures
+import hashlib
+import os
+import struct
+import zlib
+
+import a2data
+import common
+import compression
+import parser
+import terrain
+
+
+png_signature = b'\x89PNG\r\n\x1a\n'
+hash_key = b'alm-hash'
+
+# By the names in terrain.terrain_names, so both modules agree on what a kind is.
+terrain_colors = {
+	'ground': (150, 120, 80),
+	'grass': (80, 140, 60),
+	'water': (40, 80, 170),
+	'road': (190, 165, 120),
+}
+unknown_color = (200, 0, 200)
+OBJECTS = 16
+object_color = (30, 80, 30)
+
+overlay_colors = {
+	'buildings': (220, 220, 220),
+	'effects': (220, 0, 220),
+	'bags': (255, 220, 0),
+	'units': (230, 30, 30),
+}
+
+
+def _shade(color, height):
+	factor = 0.55 + 0.45 * height / 255
+	return bytes(min(255, int(c * factor)) for c in color)
+
+
+def _terrain_name(kind):
+	return terrain.terrain_names[kind] if kind < len(terrain.terrain_names) else None
+
+
+# Color of every (terrain kind or OBJECTS) << 8 | height combination.
+palette = [
+	_shade(object_color if kind == OBJECTS else terrain_colors.get(_terrain_name(kind), unknown_color), height)
+	for kind in range(OBJECTS + 1)
+	for height in range(256)
+]
+palette_digest = hashlib.sha1(b''.join(palette) + repr(sorted(overlay_colors.items())).encode()).digest()
+
+
+def terrain_pixels(layers: terrain.Layers):
+	# Returns the RGB pixels of the terrain, one per cell, as a bytearray in row order.
+	if terrain.numpy is not None:
+		numpy = terrain.numpy
+		lut = numpy.frombuffer(b''.join(palette), dtype=numpy.uint8).reshape(-1, 3)
+		kinds = ((layers.tiles & 0xF00) >> 8).astype(numpy.int32)
+		kinds = numpy.where(layers.objects != 0, OBJECTS, kinds)
+		return bytearray(lut[(kinds << 8) | layers.heights].tobytes())
+
+	return bytearray(b''.join(
+		palette[(OBJECTS if o else terrain.terrain_kind(tile)) << 8 | h]
+		for tile, h, o in zip(layers.tiles, layers.heights, layers.objects)
+	))
+
+
+def overlay_points(allods_map: a2data.AllodsMap, overlays):
+	for name in overlay_colors:
+		if name not in overlays:
+			continue
+		if name == 'units':
+			points = allods_map.units
+		elif name == 'bags':
+			points = [bag for bag in allods_map.bags if bag.unit_id == 0]
+		elif name == 'buildings':
+			points = allods_map.buildings
+		else:
+			points = [effect for effect in allods_map.effects if effect.x and effect.y]
+		yield overlay_colors[name], [(p.x, p.y) for p in points]
+
+
+def render(layers: terrain.Layers, allods_map=None, overlays=(), scale=1, text=None) -> bytes:
+	width, height = layers.width, layers.height
+	pixels = terrain_pixels(layers)
+
+	if allods_map is not None:
+		for color, points in overlay_points(allods_map, overlays):
+			for x, y in points:
+				if 0 <= x < width and 0 <= y < height:
+					p = (y * width + x) * 3
+					pixels[p:p + 3] = bytes(color)
+
+	rows = []
+	stride = width * 3
+	for y in range(height):
+		row = pixels[y * stride:(y + 1) * stride]
+		if scale > 1:
+			row = b''.join(row[i:i + 3] * scale for i in range(0, stride, 3))
+		rows.extend([b'\x00' + bytes(row)] * scale)
+
+	return encode_png(width * scale, height * scale, b''.join(rows), text)
+
+
+def _chunk(kind, data):
+	return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def encode_png(width, height, filtered_rows, text=None):
+	# 8-bit RGB, rows already prefixed with their filter byte.
+	header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+	chunks = [_chunk(b'IHDR', header)]
+	if text:
+		for key, value in text.items():
+			chunks.append(_chunk(b'tEXt', key + b'\x00' + value))
+	chunks.append(_chunk(b'IDAT', zlib.compress(filtered_rows, 6)))
+	chunks.append(_chunk(b'IEND', b''))
+	return png_signature + b''.join(chunks)
+
+
+def read_text(filename):
+	# Reads tEXt chunks that precede the image data, without decompressing anything.
+	text = {}
+	with open(filename, 'rb') as inf:
+		if inf.read(len(png_signature)) != png_signature:
+			return text
+		while True:
+			head = inf.read(8)
+			if len(head) != 8:
+				break
+			size, kind = struct.unpack('>I4s', head)
+			if kind == b'IDAT':
+				break
+			data = inf.read(size)
+			inf.read(4)
+			if kind == b'tEXt' and b'\x00' in data:
+				key, value = data.split(b'\x00', 1)
+				text[key] = value
+	return text
+
+
+def content_hash(data, overlays, scale):
+	digest = hashlib.sha1(data)
+	digest.update(repr((sorted(overlays), scale)).encode())
+	# Pictures drawn with other colors are not up to date either.
+	digest.update(palette_digest)
+	return digest.hexdigest().encode()
+
+
+def png_paths(filenames, output_directory):
+	# file -> its PNG in `output_directory`, kept in the subdirectories the maps are in.
+	return {f: os.path.splitext(compression.base_name(path))[0] + '.png' for f, path in common.output_paths(filenames, output_directory).items()}
+
+
+def render_file(fname, target, overlays=(), scale=1):
+	# Renders one map into `target`; skipped when the PNG there was made from the same content.
+	try:
+		with compression.open_file(fname) as inf:
+			data = inf.read()
+	except compression.errors as error:
+		raise parser.ParseException(f'failed to read {fname!r}') from error
+	digest = content_hash(data, overlays, scale)
+
+	if os.path.exists(target) and read_text(target).get(hash_key) == digest:
+		return target, False
+
+	try:
+		if overlays:
+			allods_map = parser.Parser(data).parse()
+			layers = terrain.layers_from_map(allods_map)
+		else:
+			allods_map = None
+			layers = terrain.read_layers(data)
+	except Exception as error:
+		raise parser.ParseException(f'failed to parse {fname!r}') from error
+
+	png = render(layers, allods_map, overlays, scale, {hash_key: digest})
+
+	os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+	temporary = target + '.tmp'
+	with open(temporary, 'wb') as outf:
+		outf.write(png)
+	os.replace(temporary, target)
+	return target, True
+
+
+def _render_file(fname, target, overlays, scale):
+	# For batches: (whether the PNG was rendered, None), or (None, error message) for a map
+	# that cannot be read.
+	try:
+		return render_file(fname, target, overlays, scale)[1], None
+	except (parser.ParseException, OSError) as error:
+		return None, common.error_message(error)
+
+
+def _in_order(filenames, targets, first, results):
+	# `results` are those of the first map of every PNG, the other maps of a PNG are errors.
+	for f in filenames:
+		if first[targets[f]] != f:
+			yield f, targets[f], None, f'{f!r} is not rendered: {targets[f]!r} is the minimap of {first[targets[f]]!r}'
+		else:
+			fresh, error = next(results)
+			yield f, targets[f], fresh, error
+
+
+def render_files(filenames, output_directory, overlays=(), scale=1, jobs=1):
+	# Yields (file, PNG file, whether it was rendered, error) in the order of `filenames`.
+	targets = png_paths(filenames, output_directory)
+	first = {}
+	for f in filenames:
+		first.setdefault(targets[f], f)
+	todo = [f for f in filenames if first[targets[f]] == f]
+
+	if jobs <= 1:
+		yield from _in_order(filenames, targets, first, (_render_file(f, targets[f], overlays, scale) for f in todo))
+		return
+
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+		futures = [executor.submit(_render_file, f, targets[f], overlays, scale) for f in todo]
+		yield from _in_order(filenames, targets, first, (future.result() for future in futures))
@@ -1,8 +1,14 @@
+import collections
+import functools
 import os
 import struct
 import sys
+import threading
+import time
 
 import a2data
+import compression
+import resfile
 
 
 class ParseException(Exception):
@@ -14,25 +20,55 @@ class GenericParser:
 		self.data = data
 		self.p = 0
 
-	def eat(self, fmt):
-		size = fmt.size()
-		content = struct.unpack(fmt.as_struct(), self.data[self.p:self.p+size])
+	def read(self, size):
+		chunk = self.data[self.p:self.p+size]
 		self.p += size
+		return chunk
+
+	def eat(self, fmt):
+		content = struct.unpack(fmt.as_struct(), self.read(fmt.size()))
 		return fmt.from_unpacked(content)
 
 
 class Parser(GenericParser):
+	def __init__(self, data, lazy=False):
+		# With `lazy`, records of the formats that allow it are returned as views decoding
+		# their fields on access (see a2data.RecordView). Views keep `data` alive.
+		super().__init__(data)
+		self.lazy = lazy
+
+	def eat(self, fmt):
+		if not (self.lazy and fmt._lazy):
+			return super().eat(fmt)
+		if self.p + fmt.size() > len(self.data):
+			raise ParseException(f'unexpected end of data around p={self.p}: wanted {fmt.size()} bytes, got {len(self.data) - self.p}')
+		self.p += fmt.size()
+		return fmt.view(self.data, self.p - fmt.size())
+
 	def parse(self) -> a2data.AllodsMap:
+		records = collections.defaultdict(list)
+		for kind, record in self.events():
+			records[kind].append(record)
+
+		if self.p != len(self.data):
+			raise ParseException(f'trailing data: {self.p} != {len(self.data)}')
+
+		return build_map(records)
+
+	def events(self):
+		# Yields (kind, record) pairs in file order: 'header', 'section', one event per record
+		# ('info', 'tile', 'unit', 'bag', 'trigger', ...) and finally 'end'.
 		header = self.eat(a2data.Header())
-		
+
 		if header.signature != a2data.alm_signature:
 			raise ParseException(f'incorrect signature: {header.signature}')
 		if header.version != a2data.alm_version:
 			raise ParseException(f'unhandled version: {header.version} != {a2data.alm_version}')
 
-		section_signature = None
+		yield 'header', header
 
-		tiles, heights, objects, buildings, players = [], [], [], [], []
+		section_signature = None
+		info = None
 
 		for s in range(header.num_sections):
 			section_header = self.eat(a2data.SectionHeader())
@@ -43,107 +79,326 @@ class Parser(GenericParser):
 			if section_header.signature != section_signature:
 				raise ParseException(f'incorrect section signature: {section_header.signature} != {section_signature} around p={self.p}')
 
-			if 0 <= section_header.id <= 5:
-				section_type = getattr(a2data, f'Section{section_header.id}')
-				stop_at = self.p + section_header.section_size
-
-				while self.p < stop_at:
-					section = self.eat(section_type())
-					if section_header.id == 0:
-						info = section
-					elif section_header.id == 1:
-						tiles.append(section.tile)
-					elif section_header.id == 2:
-						heights.append(section.height)
-					elif section_header.id == 3:
-						objects.append(section.object_id)
-					elif section_header.id == 4:
-						if section.type_id >= 0x1000000:
-							bridge_size = self.eat(a2data.BridgeSize())
-							section.bridge_width = bridge_size.bridge_width
-							section.bridge_height = bridge_size.bridge_height
-
-						buildings.append(section)
-					elif section_header.id == 5:
-						players.append(section)
-			elif section_header.id == 6:
-				units = self.parse_units(info.num_units)
-			elif section_header.id == 7:
-				instances, checks, triggers = self.parse_logics()
-			elif section_header.id == 8:
-				bags = self.parse_bags(info.num_bags)
-			elif section_header.id == 9:
-				effects = self.parse_effects()
-			elif section_header.id == 10:
-				groups = self.parse_groups(info.num_groups)
-			elif section_header.id == 11:
-				inns, shops, signs = self.parse_shops(info.num_inns, info.num_shops, info.num_signs)
-			elif section_header.id == 12:
-				music = self.parse_music(info.num_music)
-			else:
-				raise ParseException('unhandled section with id {section_header.id}')
-
-		if self.p != len(self.data):
-			raise ParseException(f'trailing data: {self.p} != {len(self.data)}')
-		return a2data.AllodsMap(info, tiles, heights, objects, units, buildings, players, instances, checks, triggers, bags, effects, groups, inns, shops, signs, music)
+			yield 'section', section_header
+
+			for kind, record in self.section_events(section_header, info):
+				if kind == 'info':
+					info = record
+				yield kind, record
+
+		yield 'end', header
+
+	def section_events(self, section_header, info):
+		if section_header.id > 5 and info is None:
+			raise ParseException(f'section {section_header.id} comes before the generic info section')
+
+		if 0 <= section_header.id <= 5:
+			section_type = getattr(a2data, f'Section{section_header.id}')
+			stop_at = self.p + section_header.section_size
+
+			while self.p < stop_at:
+				section = self.eat(section_type())
+				if section_header.id == 0:
+					yield 'info', section
+				elif section_header.id == 1:
+					yield 'tile', section.tile
+				elif section_header.id == 2:
+					yield 'height', section.height
+				elif section_header.id == 3:
+					yield 'object', section.object_id
+				elif section_header.id == 4:
+					if section.type_id >= 0x1000000:
+						bridge_size = self.eat(a2data.BridgeSize())
+						section.bridge_width = bridge_size.bridge_width
+						section.bridge_height = bridge_size.bridge_height
+
+					yield 'building', section
+				elif section_header.id == 5:
+					yield 'player', section
+		elif section_header.id == 6:
+			yield from self.parse_units(info.num_units)
+		elif section_header.id == 7:
+			yield from self.parse_logics()
+		elif section_header.id == 8:
+			yield from self.parse_bags(info.num_bags)
+		elif section_header.id == 9:
+			yield from self.parse_effects()
+		elif section_header.id == 10:
+			yield from self.parse_groups(info.num_groups)
+		elif section_header.id == 11:
+			yield from self.parse_shops(info.num_inns, info.num_shops, info.num_signs)
+		elif section_header.id == 12:
+			yield from self.parse_music(info.num_music)
+		else:
+			raise ParseException(f'unhandled section with id {section_header.id}')
 
 	def parse_effects(self):
 		section = self.eat(a2data.Effects())
-		effects = []
 		for i in range(section.num_effects):
 			effect = self.eat(a2data.Effect())
 			effect.modifiers = [self.eat(a2data.EffectModifier()) for j in range(effect.num_modifiers)]
-			effects.append(effect)
-		return effects
+			yield 'effect', effect
 
 	def parse_shops(self, num_inns, num_shops, num_signs):
-		inns = [self.eat(a2data.Inn()) for i in range(num_inns)]
-		shops = [self.eat(a2data.Shop()) for i in range(num_shops)]
-		signs = [self.eat(a2data.Sign()) for i in range(num_signs)]
-		return inns, shops, signs
+		for i in range(num_inns):
+			yield 'inn', self.eat(a2data.Inn())
+		for i in range(num_shops):
+			yield 'shop', self.eat(a2data.Shop())
+		for i in range(num_signs):
+			yield 'sign', self.eat(a2data.Sign())
 
 	def parse_bags(self, num_bags):
-		bags = []
 		for i in range(num_bags):
 			bag = self.eat(a2data.Bag())
 			bag.items = [self.eat(a2data.BagItem()) for j in range(bag.num_items)]
-			bags.append(bag)
-		return bags
+			yield 'bag', bag
 
 	def parse_units(self, num_units):
-		return [self.eat(a2data.Unit()) for i in range(num_units)]
+		for i in range(num_units):
+			yield 'unit', self.eat(a2data.Unit())
 
 	def parse_logics(self):
 		num_instances = self.eat(a2data.Instances()).num_instances
-		instances = [self.eat(a2data.Instance()) for i in range(num_instances)]
-		instances_dict = {e.index: e for e in instances}
-		if len(instances) != len(instances_dict):
-			raise ParseException(f'some instances have the same index: s{len(instances)} != {len(instances_dict)}: {instances}')
+		for i in range(num_instances):
+			yield 'instance', self.eat(a2data.Instance())
 
 		num_checks = self.eat(a2data.Instances()).num_instances
-		checks = [self.eat(a2data.Instance()) for i in range(num_checks)]
-		checks_dict = {e.index: e for e in checks}
-		if any(x != 0 for x in checks_dict):
-			if len(checks) != len(checks_dict):
-				raise ParseException(f'checks are not unique: {len(checks)} != {len(checks_dict)}: {checks}')
+		for i in range(num_checks):
+			yield 'check', self.eat(a2data.Instance())
 
 		num_triggers = self.eat(a2data.Instances()).num_instances
-		triggers = [self.eat(a2data.Trigger()) for i in range(num_triggers)]
-
-		return instances_dict, checks_dict, triggers
+		for i in range(num_triggers):
+			yield 'trigger', self.eat(a2data.Trigger())
 
 	def parse_groups(self, num_groups):
-		return [self.eat(a2data.Group()) for i in range(num_groups)]
+		for i in range(num_groups):
+			yield 'group', self.eat(a2data.Group())
 
 	def parse_music(self, num_music):
-		return [self.eat(a2data.Music()) for i in range(num_music + 1)]
+		for i in range(num_music + 1):
+			yield 'music', self.eat(a2data.Music())
+
+
+class StreamParser(Parser):
+	# Reads records sequentially from a file-like object instead of a buffer, so only the
+	# record being decoded is held in memory. Several maps may follow each other in the stream.
+	def __init__(self, stream):
+		super().__init__(b'')
+		self.stream = stream
+		self.pending = b''
+
+	def read(self, size):
+		chunk = self.pending + self.stream.read(size - len(self.pending))
+		self.pending = b''
+		if len(chunk) != size:
+			raise ParseException(f'unexpected end of stream around p={self.p}: wanted {size} bytes, got {len(chunk)}')
+		self.p += size
+		return chunk
+
+	def at_end(self):
+		if not self.pending:
+			self.pending = self.stream.read(1)
+		return not self.pending
+
+	def all_events(self):
+		while not self.at_end():
+			yield from self.events()
+
+
+def build_map(records, problem=None) -> a2data.AllodsMap:
+	# Assembles a map from parsed records. Inconsistencies raise, or are passed to `problem`
+	# and worked around when it is given.
+	def report(message):
+		if problem is None:
+			raise ParseException(message)
+		problem(message)
+
+	if not records['info']:
+		raise ParseException('map has no generic info section')
+
+	instances = {e.index: e for e in records['instance']}
+	if len(records['instance']) != len(instances):
+		report(f'some instances have the same index: s{len(records["instance"])} != {len(instances)}: {records["instance"]}')
+
+	checks = {e.index: e for e in records['check']}
+	if any(x != 0 for x in checks):
+		if len(records['check']) != len(checks):
+			report(f'checks are not unique: {len(records["check"])} != {len(checks)}: {records["check"]}')
+
+	return a2data.AllodsMap(
+		records['info'][0], records['tile'], records['height'], records['object'], records['unit'], records['building'],
+		records['player'], instances, checks, records['trigger'], records['bag'], records['effect'], records['group'],
+		records['inn'], records['shop'], records['sign'], records['music'],
+	)
+
+
+class SectionParser(Parser):
+	# Decodes one section for RecoveringParser. A unit, building or bag whose coordinates are
+	# not a map cell is kept, moved to the cell they fall into, and reported to `problem`
+	# instead of failing the whole section.
+	def __init__(self, data, problem):
+		super().__init__(data)
+		self.problem = problem
+		self.counts = collections.Counter()
+
+	def eat(self, fmt):
+		start = self.p
+		content = struct.unpack(fmt.as_struct(), self.read(fmt.size()))
+		self.counts[fmt.__class__] += 1
+		try:
+			return fmt.from_unpacked(content)
+		except AssertionError:
+			pass
+
+		record = fmt.from_unpacked(content, convert=False)
+		raw = ', '.join(str(getattr(record, k)) for k in record._alm_fields)
+		record._from_alm(checked=False)
+		name = fmt.__class__.__name__.lower()
+		number = getattr(record, f'{name}_id', None) or f'#{self.counts[fmt.__class__]}'
+		self.problem(f'{name} {number} has coordinates ({raw}) that are not a map cell', start)
+		return record
+
+
+class RecoveringParser(Parser):
+	# Parses what it can: every section is decoded on its own within the bounds given by its
+	# header, a damaged one is skipped and the problems are collected in `diagnostics`.
+	def __init__(self, data):
+		super().__init__(data)
+		self.diagnostics = []
+		# Ids of the sections whose records are missing from the map.
+		self.skipped = set()
 
+	def _diagnose(self, severity, message, section=None, offset=None):
+		self.diagnostics.append({'severity': severity, 'section': section, 'offset': offset, 'message': message})
 
-def parse(f) -> a2data.AllodsMap:
-	with open(f, 'rb') as inf:
+	def parse(self):
+		# Returns a partially populated map, or None if not even the generic info could be read.
 		try:
-			return Parser(inf.read()).parse()
+			header = self.eat(a2data.Header())
 		except Exception as error:
+			self._diagnose('error', f'cannot read the map header: {error}', offset=0)
+			return None
+
+		if header.signature != a2data.alm_signature:
+			self._diagnose('error', f'incorrect signature: {header.signature}', offset=0)
+			return None
+		if header.version != a2data.alm_version:
+			self._diagnose('warning', f'unhandled version: {header.version} != {a2data.alm_version}', offset=0)
+
+		records = collections.defaultdict(list)
+		section_signature = None
+		info = None
+
+		for s in range(header.num_sections):
+			offset = self.p
+			if offset + a2data.SectionHeader.size() > len(self.data):
+				self._diagnose('error', f'data ends before section {s + 1} of {header.num_sections}', offset=offset)
+				break
+
+			section_header = self.eat(a2data.SectionHeader())
+			section_id = section_header.id
+
+			if section_signature is None:
+				section_signature = section_header.signature
+			if section_header.signature != section_signature:
+				self._diagnose('warning', f'incorrect section signature: {section_header.signature} != {section_signature}', section_id, offset)
+
+			start = self.p
+			size = section_header.section_size
+			if section_id == 0:
+				size = max(size, a2data.GenericInfo.size())
+			end = start + size
+			if end > len(self.data):
+				self._diagnose('error', f'section is cut off: ends at {end}, data ends at {len(self.data)}', section_id, offset)
+				end = len(self.data)
+
+			body = SectionParser(self.data[start:end], lambda message, position: self._diagnose('error', message, section_id, start + position))
+			section_records = collections.defaultdict(list)
+			try:
+				for kind, record in body.section_events(section_header, info):
+					section_records[kind].append(record)
+				if body.p != end - start:
+					raise ParseException(f'section size is {end - start}, but its records take {body.p}')
+			except Exception as error:
+				self._diagnose('error', f'skipped: {str(error) or error.__class__.__name__}', section_id, offset)
+				self.skipped.add(section_id)
+			else:
+				for kind, values in section_records.items():
+					records[kind].extend(values)
+				if section_records['info']:
+					info = section_records['info'][0]
+
+			self.p = end
+
+		if self.p != len(self.data):
+			self._diagnose('warning', f'trailing data: {self.p} != {len(self.data)}', offset=self.p)
+
+		if info is None:
+			self._diagnose('error', 'map has no readable generic info section')
+			return None
+
+		return build_map(records, lambda message: self._diagnose('warning', message))
+
+
+def scan(f):
+	# Parses a file in recovering mode: returns (map or None, diagnostics).
+	allods_map, diagnostics, skipped = scan_sections(f)
+	return allods_map, diagnostics
+
+
+def scan_sections(f):
+	# Like `scan`, also returns the ids of the sections that were skipped.
+	try:
+		with compression.open_file(f) as inf:
+			data = inf.read()
+	except compression.errors as error:
+		return None, [{'severity': 'error', 'section': None, 'offset': None, 'message': str(error)}], set()
+
+	scanner = RecoveringParser(data)
+	return scanner.parse(), scanner.diagnostics, scanner.skipped
+
+
+def section_table(data):
+	# Locates sections by their headers without decoding them: returns the map header and a
+	# list of (section header, start, end) byte ranges of the section bodies.
+	reader = GenericParser(data)
+	header = reader.eat(a2data.Header())
+
+	if header.signature != a2data.alm_signature:
+		raise ParseException(f'incorrect signature: {header.signature}')
+
+	sections = []
+	for s in range(header.num_sections):
+		section_header = reader.eat(a2data.SectionHeader())
+		size = section_header.section_size
+		if section_header.id == 0:
+			# Some editors store a short size for the generic info, the parser reads it whole anyway.
+			size = max(size, a2data.GenericInfo.size())
+
+		start = reader.p
+		reader.p += size
+		if reader.p > len(data):
+			raise ParseException(f'section {section_header.id} ends past the end of data: {reader.p} > {len(data)}')
+		sections.append((section_header, start, reader.p))
+
+	return header, sections
+
+
+def parse(f, lazy=False) -> a2data.AllodsMap:
+	# .alm.gz and .alm.xz maps are decompressed transparently, see `compression`.
+	try:
+		with compression.open_file(f) as inf:
+			return Parser(inf.read(), lazy).parse()
+	except Exception as error:
+		raise ParseException(f'failed to parse {f!r}') from error
+
+
+def parse_events(f):
+	with compression.open_file(f) as inf:
+		try:
+			yield from StreamParser(inf).all_events()
+		except (ParseException, *compression.errors) as error:
+			# A damaged compressed file fails while it is being read.
 			raise ParseException(f'failed to parse {f!r}') from error
 
 
@@ -236,12 +491,134 @@ class UnitKindParser(GenericParser):
 		return s.decode('utf-8')
 
 
+item_modifiers = [
+	'none',
+	'price',
+	'body',
+	'mind',
+	'reaction',
+	'spirit',
+	'health',
+	'healthmax',
+	'healthregeneration',
+	'mana',
+	'manamax',
+	'manaregeneration',
+	'tohit',
+	'damagemin',
+	'damagemax',
+	'defence',
+	'absorbtion',
+	'speed',
+	'rotationspeed',
+	'scanrange',
+	'protection0',
+	'protectionfire',
+	'protectionwater',
+	'protectionair',
+	'protectionearth',
+	'protectionastral',
+	'fighterskill0',
+	'skillblade',
+	'skillaxe',
+	'skillbludgeon',
+	'skillpike',
+	'skillshooting',
+	'mageskill0',
+	'skillfire',
+	'skillwater',
+	'skillair',
+	'skillearth',
+	'skillastral',
+	'itemlore',
+	'magiclore',
+	'creaturelore',
+	'damagebonus',
+]
+
+
+def _loaded_property(load):
+	# Like functools.cached_property, but loaded only once when several threads ask for it at
+	# the same time (the daemon answers requests in threads): loading holds the instance lock.
+	name = load.__name__
+
+	@functools.wraps(load)
+	def get(self):
+		if name in self.__dict__:
+			return self.__dict__[name]
+		with self._lock:
+			if name not in self.__dict__:
+				self.__dict__[name] = load(self)
+			return self.__dict__[name]
+	return property(get)
+
+
+def _timed_property(load):
+	# A loaded property that records how long loading it took in `load_times`.
+	@functools.wraps(load)
+	def timed(self):
+		start = time.perf_counter()
+		try:
+			return load(self)
+		finally:
+			self.load_times[load.__name__] = time.perf_counter() - start
+	return _loaded_property(timed)
+
+
 class EngineData:
-	def __init__(self, item_names, spell_names, item_modifiers, unit_kinds):
-		self.item_names = item_names
-		self.spell_names = spell_names
-		self.item_modifiers = item_modifiers
-		self.unit_kinds = unit_kinds
+	# Every component is loaded from the game directory on first access, so code paths
+	# that never look at names (JSON export, --save) work without the game installed.
+	item_modifiers = item_modifiers
+
+	def __init__(self, data_directory=None, filenames=()):
+		self._data_directory = data_directory
+		self._filenames = list(filenames)
+		self.load_times = {}
+		# Reentrant: loading one component loads those it is made from.
+		self._lock = threading.RLock()
+
+	@_loaded_property
+	def data_directory(self):
+		if self._data_directory:
+			return self._data_directory
+		return find_data_directory(self._filenames)
+
+	@_timed_property
+	def data_files(self):
+		return resfile.DataDirectory(self.data_directory)
+
+	@_timed_property
+	def item_ids(self):
+		# Item ids the game knows, without their names.
+		return parse_item_ids(self.data_files)
+
+	@_timed_property
+	def item_names(self):
+		return parse_item_names(self.data_files)
+
+	@_timed_property
+	def spell_names(self):
+		return parse_spell_names(self.data_files)
+
+	@_timed_property
+	def unit_kinds(self):
+		return parse_databin(self.data_files.read('world/data/data.bin').strip())
+
+	@_loaded_property
+	def spell_index(self):
+		import engine_index
+		return engine_index.SpellIndex(self.unit_kinds)
+
+	@_loaded_property
+	def drop_index(self):
+		import engine_index
+		return engine_index.DropIndex(self.unit_kinds)
+
+	def spell_casters(self, spell_id):
+		return self.spell_index.casters(spell_id)
+
+	def droppers(self, drop_mask, price=None):
+		return self.drop_index.droppers(drop_mask, price)
 
 	def unit_name(self, server_id):
 		if server_id in self.unit_kinds:
@@ -249,29 +626,38 @@ class EngineData:
 		return f'(!failed to find unit: server_id={server_id})'
 
 
+def find_data_directory(filenames):
+	if not filenames:
+		raise FileNotFoundError('specify --allods_data_directory')
+
+	d = os.path.abspath(os.path.dirname(filenames[0]))
+	while d != os.path.dirname(d):
+		# Only the path is returned: the archives the candidate opened are closed.
+		with resfile.DataDirectory(os.path.join(d, 'data')) as candidate:
+			if candidate.exists('world/data/itemname.bin'):
+				return os.path.join(d, 'data')
+		d = os.path.dirname(d)
+
+	raise FileNotFoundError('failed to determine data directory, specify --allods_data_directory')
+
+
 def parse_engine_data(data_directory, filenames) -> EngineData:
-	if not data_directory:
-		if not filenames:
-			raise Exception('specify --allods_data_directory')
-
-		d = os.path.abspath(os.path.dirname(filenames[0]))
-		while d != os.path.dirname(d):
-			if os.path.exists(os.path.join(d, 'data/world/data/itemname.bin')):
-				data_directory = os.path.join(d, 'data')
-				break
-			d = os.path.dirname(d)
-		if not data_directory:
-			raise Exception('failed to determine data directory, specify --allods_data_directory')
+	return EngineData(data_directory, filenames)
 
-	with open(os.path.join(data_directory, 'world/data/itemname.bin'), 'rb') as inf:
-		itemname_bin = inf.read()
+
+def parse_item_ids(data_files: resfile.DataDirectory):
+	itemname_bin = data_files.read('world/data/itemname.bin')
 
 	item_ids = []
 	for i in range(0, len(itemname_bin), 2):
 		item_ids.append(itemname_bin[i+1] << 8 | itemname_bin[i])
+	return item_ids
+
 
-	with open(os.path.join(data_directory, 'locale/en/itemname.txt'), 'r', encoding='cp1251') as inf:
-		itemserv = inf.read().strip()
+def parse_item_names(data_files: resfile.DataDirectory):
+	item_ids = parse_item_ids(data_files)
+
+	itemserv = data_files.read_text('locale/en/itemname.txt').strip()
 
 	item_names = itemserv.split('\n')
 
@@ -281,61 +667,12 @@ def parse_engine_data(data_directory, filenames) -> EngineData:
 	item_map = {}
 	for i, item_id in enumerate(item_ids):
 		item_map[a2data.Hex(item_id)] = item_names[i]
+	return item_map
+
 
-	with open(os.path.join(data_directory, 'locale/en/spell.txt'), 'r', encoding='cp1251') as inf:
-		spell = inf.read().strip()
-	spell_names = spell.split('\n')
-
-	item_modifiers = [
-		'none',
-		'price',
-		'body',
-		'mind',
-		'reaction',
-		'spirit',
-		'health',
-		'healthmax',
-		'healthregeneration',
-		'mana',
-		'manamax',
-		'manaregeneration',
-		'tohit',
-		'damagemin',
-		'damagemax',
-		'defence',
-		'absorbtion',
-		'speed',
-		'rotationspeed',
-		'scanrange',
-		'protection0',
-		'protectionfire',
-		'protectionwater',
-		'protectionair',
-		'protectionearth',
-		'protectionastral',
-		'fighterskill0',
-		'skillblade',
-		'skillaxe',
-		'skillbludgeon',
-		'skillpike',
-		'skillshooting',
-		'mageskill0',
-		'skillfire',
-		'skillwater',
-		'skillair',
-		'skillearth',
-		'skillastral',
-		'itemlore',
-		'magiclore',
-		'creaturelore',
-		'damagebonus',
-	]
-
-	with open(os.path.join(data_directory, 'world/data/data.bin'), 'rb') as inf:
-		databin = inf.read().strip()
-	unit_kinds = parse_databin(databin)
-
-	return EngineData(item_map, spell_names, item_modifiers, unit_kinds)
+def parse_spell_names(data_files: resfile.DataDirectory):
+	spell = data_files.read_text('locale/en/spell.txt').strip()
+	return spell.split('\n')
 
 
 def parse_databin(databin):
@@ -0,0 +1,182 @@
+import collections
+import weakref
+
+import a2data
+import terrain
+
+
+START_LOCATION = 65538
+
+_cache = weakref.WeakKeyDictionary()
+
+
+def passability_grid(allods_map: a2data.AllodsMap):
+	# 1 for cells a unit can stand on. Water and objects block a cell, so does the anchor
+	# cell of a building (footprints are not stored in the map). Bridges make their area passable.
+	width, height = allods_map.info.width, allods_map.info.height
+	passable = bytearray(
+		1 if terrain.terrain_kind(tile) != terrain.WATER and not o else 0
+		for tile, o in zip(allods_map.tiles, allods_map.objects)
+	)
+
+	for building in allods_map.buildings:
+		if building.type_id >= 0x1000000:
+			for y in range(max(building.y, 0), min(building.y + building.bridge_height, height)):
+				for x in range(max(building.x, 0), min(building.x + building.bridge_width, width)):
+					passable[y * width + x] = 1
+		elif 0 <= building.x < width and 0 <= building.y < height:
+			passable[building.y * width + building.x] = 0
+
+	return passable
+
+
+def label_regions(passable, width, height):
+	# Scanline flood fill with 8-connectivity. Returns per-cell region numbers (0 for blocked
+	# cells) and the size of every region, indexed by region number.
+	regions = [0] * (width * height)
+	sizes = [0]
+
+	for seed in range(width * height):
+		if not passable[seed] or regions[seed]:
+			continue
+
+		label = len(sizes)
+		size = 0
+		stack = [seed]
+		while stack:
+			p = stack.pop()
+			if regions[p]:
+				continue
+			y, x = divmod(p, width)
+			row = y * width
+
+			left = x
+			while left > 0 and passable[row + left - 1] and not regions[row + left - 1]:
+				left -= 1
+			right = x
+			while right < width - 1 and passable[row + right + 1] and not regions[row + right + 1]:
+				right += 1
+
+			for i in range(row + left, row + right + 1):
+				regions[i] = label
+			size += right - left + 1
+
+			for ny in (y - 1, y + 1):
+				if not 0 <= ny < height:
+					continue
+				nrow = ny * width
+				inside = False
+				for nx in range(max(left - 1, 0), min(right + 2, width)):
+					open_cell = passable[nrow + nx] and not regions[nrow + nx]
+					if open_cell and not inside:
+						stack.append(nrow + nx)
+					inside = open_cell
+
+		sizes.append(size)
+
+	return regions, sizes
+
+
+class Reachability:
+	def __init__(self, allods_map: a2data.AllodsMap):
+		self.width = allods_map.info.width
+		self.height = allods_map.info.height
+		self.passable = passability_grid(allods_map)
+		self.regions, self.sizes = label_regions(self.passable, self.width, self.height)
+
+	def region_at(self, x, y):
+		if not (0 <= x < self.width and 0 <= y < self.height):
+			return 0
+		return self.regions[y * self.width + x]
+
+	def regions_of(self, where):
+		# Entities may stand on a blocked cell (a building, a unit on top of an object), then
+		# they are reachable from any region next to them.
+		x, y = _position(where)
+		region = self.region_at(x, y)
+		if region:
+			return {region}
+		return {self.region_at(x + dx, y + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)} - {0}
+
+	def reachable(self, a, b):
+		return bool(self.regions_of(a) & self.regions_of(b))
+
+	def distance(self, a, b):
+		# Shortest walk in cells between two entities, diagonal steps included, or None.
+		if not self.reachable(a, b):
+			return None
+
+		ax, ay = _position(a)
+		bx, by = _position(b)
+		if (ax, ay) == (bx, by):
+			return 0
+
+		target = by * self.width + bx
+		seen = {ay * self.width + ax}
+		queue = collections.deque([(ax, ay, 0)])
+		while queue:
+			x, y, d = queue.popleft()
+			for dx in (-1, 0, 1):
+				for dy in (-1, 0, 1):
+					nx, ny = x + dx, y + dy
+					if not (0 <= nx < self.width and 0 <= ny < self.height):
+						continue
+					p = ny * self.width + nx
+					if p == target:
+						return d + 1
+					if p in seen or not self.passable[p]:
+						continue
+					seen.add(p)
+					queue.append((nx, ny, d + 1))
+		return None
+
+
+def _position(where):
+	if isinstance(where, tuple):
+		return where
+	return where.x, where.y
+
+
+def reachability(allods_map: a2data.AllodsMap) -> Reachability:
+	# Labelling is cached per map object; call `invalidate` after editing the map.
+	if allods_map not in _cache:
+		_cache[allods_map] = Reachability(allods_map)
+	return _cache[allods_map]
+
+
+def invalidate(allods_map: a2data.AllodsMap):
+	_cache.pop(allods_map, None)
+
+
+def start_locations(allods_map: a2data.AllodsMap):
+	return [(i.arg_value[0], i.arg_value[1]) for i in allods_map.instances.values() if i.type_id == START_LOCATION]
+
+
+def main_regions(allods_map: a2data.AllodsMap):
+	# Regions of the player start locations, or the largest region if the map has none.
+	reach = reachability(allods_map)
+	regions = set()
+	for where in start_locations(allods_map):
+		regions |= reach.regions_of(where)
+	if not regions and len(reach.sizes) > 1:
+		regions = {max(range(1, len(reach.sizes)), key=lambda r: reach.sizes[r])}
+	return regions
+
+
+def report(allods_map: a2data.AllodsMap, emit):
+	reach = reachability(allods_map)
+	main = main_regions(allods_map)
+
+	emit(f'Regions: {len(reach.sizes) - 1}, main area: {sum(reach.sizes[r] for r in main)} cells')
+
+	for unit in allods_map.units:
+		if not reach.regions_of(unit) & main:
+			emit(f'  unit {unit.unit_id} at x={unit.x}, y={unit.y} is walled off')
+
+	for i, bag in enumerate(allods_map.bags):
+		if bag.unit_id == 0 and not reach.regions_of(bag) & main:
+			emit(f'  bag {i + 1} at x={bag.x}, y={bag.y} is unreachable')
+
+	for building in allods_map.buildings:
+		if building.type_id < 0x1000000 and not reach.regions_of(building) & main:
+			emit(f'  building {building.building_id} at x={building.x}, y={building.y} is unreachable')
@@ -0,0 +1,249 @@
+import collections
+import copy
+import os
+
+import a2data
+import common
+import marshaller
+import parser
+
+
+Box = collections.namedtuple('Box', 'x y width height')
+
+
+class RegionException(Exception):
+	pass
+
+
+def parse_box(text):
+	# "x,y,width,height"
+	try:
+		return Box(*(int(v) for v in text.split(',')))
+	except (TypeError, ValueError):
+		raise RegionException(f'box must be x,y,width,height: {text!r}')
+
+
+def _inside(box: Box, x, y):
+	return box.x <= x < box.x + box.width and box.y <= y < box.y + box.height
+
+
+def _is_bridge(building):
+	return building.type_id >= 0x1000000
+
+
+def _on_map(effect):
+	# Item effects have no position; see the on-map effects in the text report.
+	return effect.x != 0 and effect.y != 0
+
+
+def _effect_building(effect):
+	return effect.max_magic_damage * 256 + effect.min_magic_damage
+
+
+class Region:
+	# A rectangle cut from a map: grid rows and copies of the entities inside, with
+	# coordinates relative to the top left corner of the box.
+	def __init__(self, width, height):
+		self.width = width
+		self.height = height
+		self.tiles = []
+		self.heights = []
+		self.objects = []
+		self.units = []
+		self.buildings = []
+		self.bags = []
+		self.effects = []
+		self.groups = []
+
+
+def copy_region(allods_map: a2data.AllodsMap, box: Box) -> Region:
+	width, height = allods_map.info.width, allods_map.info.height
+	if box.width <= 0 or box.height <= 0 or box.x < 0 or box.y < 0 or box.x + box.width > width or box.y + box.height > height:
+		raise RegionException(f'{box} is not inside the {width}x{height} map')
+
+	region = Region(box.width, box.height)
+	for y in range(box.y, box.y + box.height):
+		start = y * width + box.x
+		region.tiles.append(allods_map.tiles[start:start + box.width])
+		region.heights.append(allods_map.heights[start:start + box.width])
+		region.objects.append(allods_map.objects[start:start + box.width])
+
+	def relative(record):
+		record = copy.deepcopy(record)
+		record.x -= box.x
+		record.y -= box.y
+		return record
+
+	# Units take their bags along, bags their item effects; on-map effects are taken by position.
+	bag_indices = set()
+	effect_indices = set()
+	group_ids = set()
+	for unit in allods_map.units:
+		if _inside(box, unit.x, unit.y):
+			region.units.append(relative(unit))
+			if 0 < unit.bag_id <= len(allods_map.bags):
+				bag_indices.add(unit.bag_id - 1)
+			if unit.group_id:
+				group_ids.add(unit.group_id)
+
+	for i, bag in enumerate(allods_map.bags):
+		if i in bag_indices or (not bag.unit_id and _inside(box, bag.x, bag.y)):
+			bag_indices.add(i)
+	for i in sorted(bag_indices):
+		bag = allods_map.bags[i]
+		# Remember the original index: units and items are remapped by it when pasting.
+		region.bags.append((i + 1, relative(bag)))
+		for item in bag.items:
+			if 0 < item.effect <= len(allods_map.effects):
+				effect_indices.add(item.effect - 1)
+
+	for building in allods_map.buildings:
+		if _inside(box, building.x, building.y):
+			region.buildings.append(relative(building))
+
+	for i, effect in enumerate(allods_map.effects):
+		if _on_map(effect) and _inside(box, effect.x, effect.y):
+			effect_indices.add(i)
+	for i in sorted(effect_indices):
+		effect = copy.deepcopy(allods_map.effects[i])
+		if _on_map(effect):
+			effect.x -= box.x
+			effect.y -= box.y
+			for modifier in effect.modifiers:
+				modifier.x -= box.x
+				modifier.y -= box.y
+		region.effects.append((i + 1, effect))
+
+	region.groups = [copy.deepcopy(group) for group in allods_map.groups if group.group_id in group_ids]
+	return region
+
+
+def paste_region(allods_map: a2data.AllodsMap, region: Region, x, y):
+	# Pastes the region with its top left corner at (x, y). Entities already on the map
+	# stay; pasted units, groups and buildings get IDs after the largest ones on the map,
+	# pasted bags and effects are appended. Returns the number of pasted records by kind.
+	width, height = allods_map.info.width, allods_map.info.height
+	if x < 0 or y < 0 or x + region.width > width or y + region.height > height:
+		raise RegionException(f'{region.width}x{region.height} region at ({x}, {y}) does not fit into the {width}x{height} map')
+
+	num_players = len(allods_map.players)
+	for record in region.units + region.buildings:
+		player = record.player_id if isinstance(record, a2data.Unit) else record.player
+		if player > num_players:
+			raise RegionException(f'{record.__class__.__name__} belongs to player {player}, the map has {num_players} players')
+
+	for row in range(region.height):
+		start = (y + row) * width + x
+		allods_map.tiles[start:start + region.width] = region.tiles[row]
+		allods_map.heights[start:start + region.width] = region.heights[row]
+		allods_map.objects[start:start + region.width] = region.objects[row]
+
+	def placed(record):
+		record = copy.deepcopy(record)
+		record.x += x
+		record.y += y
+		return record
+
+	def renumber(old_ids, used):
+		first = max(used, default=0) + 1
+		return {old: first + i for i, old in enumerate(sorted(set(old_ids)))}
+
+	unit_ids = renumber((u.unit_id for u in region.units), (u.unit_id for u in allods_map.units))
+	# Units may be in groups that have no group record: such IDs count as used on the map,
+	# and the pasted units in one are kept together.
+	used_group_ids = [g.group_id for g in allods_map.groups] + [u.group_id for u in allods_map.units]
+	pasted_group_ids = [g.group_id for g in region.groups] + [u.group_id for u in region.units if u.group_id]
+	group_ids = renumber(pasted_group_ids, used_group_ids)
+	building_ids = renumber((b.building_id for b in region.buildings), (b.building_id for b in allods_map.buildings))
+	bag_indices = {old: len(allods_map.bags) + i + 1 for i, (old, bag) in enumerate(region.bags)}
+	effect_indices = {old: len(allods_map.effects) + i + 1 for i, (old, effect) in enumerate(region.effects)}
+
+	if max(unit_ids.values(), default=0) >= 0x10000 or max(building_ids.values(), default=0) >= 0x10000:
+		raise RegionException('out of 16 bit unit or building IDs')
+
+	for old, effect in region.effects:
+		effect = copy.deepcopy(effect)
+		if _on_map(effect):
+			effect.x += x
+			effect.y += y
+			for modifier in effect.modifiers:
+				modifier.x += x
+				modifier.y += y
+			# An effect cast from a building that was not pasted along loses its source.
+			building_id = building_ids.get(_effect_building(effect), 0)
+			effect.max_magic_damage, effect.min_magic_damage = divmod(building_id, 256)
+		allods_map.effects.append(effect)
+
+	for old, bag in region.bags:
+		bag = placed(bag)
+		bag.unit_id = unit_ids.get(bag.unit_id, 0)
+		for item in bag.items:
+			item.effect = effect_indices.get(item.effect, 0)
+		allods_map.bags.append(bag)
+
+	for group in region.groups:
+		group = copy.deepcopy(group)
+		group.group_id = group_ids[group.group_id]
+		# Logic is not copied, so neither is the group's instance.
+		group.instance_id = 0
+		allods_map.groups.append(group)
+
+	for building in region.buildings:
+		building = placed(building)
+		building.building_id = building_ids[building.building_id]
+		allods_map.buildings.append(building)
+
+	first_bag = len(allods_map.bags) - len(region.bags)
+	for unit in region.units:
+		unit = placed(unit)
+		unit.unit_id = unit_ids[unit.unit_id]
+		unit.group_id = group_ids.get(unit.group_id, 0)
+		unit.bag_id = bag_indices.get(unit.bag_id, 0)
+		allods_map.units.append(unit)
+		# A unit's bag may be stored anywhere, it is put where its owner is.
+		if unit.bag_id > first_bag:
+			bag = allods_map.bags[unit.bag_id - 1]
+			bag.x, bag.y = unit.x, unit.y
+
+	return collections.Counter({
+		'units': len(region.units),
+		'buildings': len(region.buildings),
+		'bags': len(region.bags),
+		'effects': len(region.effects),
+		'groups': len(region.groups),
+	})
+
+
+def paste_file(fname, region: Region, x, y, target=None, dry_run=False):
+	# Returns (fname, pasted counts, None), or (fname, None, error message) for a map that could
+	# not be read, pasted into or written. The map is written to `target` (by default over
+	# `fname`) unless this is a dry run.
+	try:
+		allods_map = parser.parse(fname)
+		pasted = paste_region(allods_map, region, x, y)
+		if not dry_run:
+			target = target or fname
+			os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+			common.write_atomically(target, marshaller.Marshaller(allods_map).marshal())
+	except RegionException as error:
+		return fname, None, f'failed to paste into {fname!r}: {common.error_message(error)}'
+	except (parser.ParseException, OSError) as error:
+		return fname, None, common.error_message(error)
+	return fname, pasted, None
+
+
+def paste_files(filenames, region: Region, x, y, output_directory=None, dry_run=False, jobs=1):
+	# Yields the results of `paste_file` in the order of `filenames`. With `output_directory`
+	# the maps keep the subdirectories they are in (see `common.output_paths`).
+	targets = common.output_paths(filenames, output_directory) if output_directory else {}
+
+	if jobs <= 1:
+		for f in filenames:
+			yield paste_file(f, region, x, y, targets.get(f), dry_run)
+		return
+
+	import concurrent.futures
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+		futures = [executor.submit(paste_file, f, region, x, y, targets.get(f), dry_run) for f in filenames]
+		for future in futures:
+			yield future.result()
@@ -0,0 +1,160 @@
+import mmap
+import os
+import struct
+
+import a2data
+
+
+res_signature = b'&YA1'
+
+
+class ResException(Exception):
+	pass
+
+
+class ResHeader(a2data.Format):
+	_map_record = False
+
+	signature = bytes(4)
+	root_offset = int(4)
+	root_size = int(4)
+	res_flags = int(4)
+	fat_offset = int(4)
+	fat_size = int(4)
+
+
+class ResEntry(a2data.Format):
+	_map_record = False
+
+	unused = int(4)
+	offset = int(4)
+	length = int(4)
+	is_directory = int(4)
+	name = str(16)
+
+
+class ResArchive:
+	# Read-only view of an Allods `.res` archive. The file is memory-mapped and only
+	# the directory table is decoded when the archive is opened.
+	def __init__(self, filename):
+		self.filename = filename
+		self._mmap = None
+		try:
+			# An empty file cannot be mapped (ValueError).
+			with open(filename, 'rb') as inf:
+				self._mmap = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+			self.files = self._read_index()
+		except Exception as error:
+			self.close()
+			raise ResException(f'failed to read archive {filename!r}') from error
+
+	def _eat(self, fmt, p):
+		return fmt.from_unpacked(struct.unpack_from(fmt.as_struct(), self._mmap, p))
+
+	def _read_index(self):
+		header = self._eat(ResHeader, 0)
+		if header.signature != res_signature:
+			raise ResException(f'incorrect signature: {header.signature}')
+
+		entry_size = ResEntry.size()
+		if header.fat_offset + header.fat_size * entry_size > len(self._mmap):
+			raise ResException(f'directory table is out of bounds: {header.fat_offset} + {header.fat_size} entries')
+
+		entries = [self._eat(ResEntry, header.fat_offset + i * entry_size) for i in range(header.fat_size)]
+
+		files = {}
+		pending = [('', header.root_offset, header.root_size)]
+		while pending:
+			prefix, first, count = pending.pop()
+			if first + count > len(entries):
+				raise ResException(f'directory {prefix!r} points outside of the table: {first} + {count} > {len(entries)}')
+
+			for entry in entries[first:first + count]:
+				path = prefix + entry.name.lower()
+				if entry.is_directory:
+					pending.append((path + '/', entry.offset, entry.length))
+				else:
+					if entry.offset + entry.length > len(self._mmap):
+						raise ResException(f'file {path!r} is out of bounds')
+					files[path] = (entry.offset, entry.length)
+		return files
+
+	def __contains__(self, path):
+		return _normalize(path) in self.files
+
+	def read(self, path) -> bytes:
+		key = _normalize(path)
+		if key not in self.files:
+			raise FileNotFoundError(f'{path!r} is not in {self.filename!r}')
+		offset, length = self.files[key]
+		return self._mmap[offset:offset + length]
+
+	def close(self):
+		if self._mmap is not None:
+			self._mmap.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+def _normalize(path):
+	return path.replace('\\', '/').strip('/').lower()
+
+
+class DataDirectory:
+	# Looks a path up in the unpacked game directory first, then in `.res` archives along
+	# the way: `world/data/data.bin` is also found as `data/data.bin` inside `world.res`.
+	def __init__(self, root):
+		self.root = root
+		self._archives = {}
+
+	def _archive(self, filename):
+		if filename not in self._archives:
+			self._archives[filename] = ResArchive(filename) if os.path.isfile(filename) else None
+		return self._archives[filename]
+
+	def _locate(self, path):
+		parts = _normalize(path).split('/')
+
+		filename = os.path.join(self.root, *parts)
+		if os.path.isfile(filename):
+			return filename, None
+
+		for i in range(len(parts) - 1, 0, -1):
+			archive = self._archive(os.path.join(self.root, *parts[:i]) + '.res')
+			if archive and '/'.join(parts[i:]) in archive:
+				return archive, '/'.join(parts[i:])
+
+		return None, None
+
+	def exists(self, path):
+		return self._locate(path)[0] is not None
+
+	def read(self, path) -> bytes:
+		where, inner = self._locate(path)
+		if where is None:
+			raise FileNotFoundError(f'{path!r} is not found in {self.root!r}')
+
+		if inner is None:
+			with open(where, 'rb') as inf:
+				return inf.read()
+		return where.read(inner)
+
+	def read_text(self, path) -> str:
+		text = self.read(path).decode('cp1251')
+		return text.replace('\r\n', '\n').replace('\r', '\n')
+
+	def close(self):
+		for archive in self._archives.values():
+			if archive:
+				archive.close()
+		self._archives = {}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
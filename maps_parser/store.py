@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+import sys
+import time
+
+import a2data
+import common
+import compression
+import parser
+
+
+# A store directory holds
+#   blobs/ab/ab01...ef.gz  raw bytes of one section (with its header), named by their sha1
+#   maps/NAME.jsonl        the revisions of a map, one manifest per line
+# A manifest lists the chunks that make up the file in order, so concatenating the blobs
+# gives back the exact bytes of the revision. Sections that did not change between
+# revisions (usually the grids) are stored once.
+
+
+class StoreException(Exception):
+	pass
+
+
+def map_name(fname):
+	# 'maps/camp.alm.gz' -> 'camp.alm'
+	return compression.base_name(os.path.basename(fname))
+
+
+def chunks(data):
+	# Splits a map into (name, bytes) along the section table: the file header, every section
+	# with its header and whatever follows the last section. A map without a readable section
+	# table is one 'raw' chunk.
+	try:
+		header, sections = parser.section_table(data)
+	except Exception:
+		return [('raw', data)]
+
+	# Sections follow each other without gaps, each one starting with its header.
+	position = a2data.Header.size()
+	result = [('header', data[:position])]
+	seen = collections.Counter()
+	for section_header, start, end in sections:
+		name = common.section_name(section_header.id)
+		seen[name] += 1
+		result.append((name if seen[name] == 1 else f'{name}#{seen[name]}', data[position:end]))
+		position = end
+	if position < len(data):
+		result.append(('trailing', data[position:]))
+	return result
+
+
+class Store:
+	def __init__(self, root):
+		self.root = root
+
+	def _blob_path(self, digest):
+		return os.path.join(self.root, 'blobs', digest[:2], digest + '.gz')
+
+	def _log_path(self, name):
+		return os.path.join(self.root, 'maps', name + '.jsonl')
+
+	def put_blob(self, data):
+		# Returns (sha1, bytes written); nothing is written for a blob the store already has.
+		digest = hashlib.sha1(data).hexdigest()
+		path = self._blob_path(digest)
+		if os.path.exists(path):
+			return digest, 0
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		common.write_atomically(path, data)
+		return digest, os.path.getsize(path)
+
+	def get_blob(self, digest):
+		try:
+			with compression.open_file(self._blob_path(digest)) as inf:
+				data = inf.read()
+		except FileNotFoundError:
+			raise StoreException(f'blob {digest} is missing')
+		if hashlib.sha1(data).hexdigest() != digest:
+			raise StoreException(f'blob {digest} is damaged')
+		return data
+
+	def maps(self):
+		directory = os.path.join(self.root, 'maps')
+		if not os.path.isdir(directory):
+			return []
+		return sorted(name[:-len('.jsonl')] for name in os.listdir(directory) if name.endswith('.jsonl'))
+
+	def revisions(self, name):
+		# Manifests of all revisions, oldest first; only the log is read.
+		path = self._log_path(name)
+		if not os.path.exists(path):
+			raise StoreException(f'no map {name!r} in the store')
+		with open(path, 'r') as inf:
+			return [json.loads(line) for line in inf if line.strip()]
+
+	def revision(self, name, revision=None):
+		# `revision` counts from 1; negative ones from the end, None is the latest.
+		revisions = self.revisions(name)
+		if revision is None:
+			revision = len(revisions)
+		index = revision - 1 if revision > 0 else len(revisions) + revision
+		if not 0 <= index < len(revisions):
+			raise StoreException(f'{name!r} has {len(revisions)} revisions, there is no revision {revision}')
+		return revisions[index]
+
+	def commit(self, fname, name=None, message=''):
+		# Adds the file as the next revision of its map. Returns (manifest, whether it is new):
+		# a file identical to the latest revision is not added again.
+		name = name or map_name(fname)
+		with compression.open_file(fname) as inf:
+			data = inf.read()
+		digest = hashlib.sha1(data).hexdigest()
+
+		revisions = self.revisions(name) if os.path.exists(self._log_path(name)) else []
+		if revisions and revisions[-1]['sha1'] == digest:
+			return revisions[-1], False
+
+		manifest = {
+			'revision': len(revisions) + 1,
+			'time': time.time(),
+			'source': fname,
+			'message': message,
+			'size': len(data),
+			'sha1': digest,
+			'stored': 0,
+			'chunks': [],
+		}
+		for chunk_name, chunk in chunks(data):
+			blob, written = self.put_blob(chunk)
+			manifest['stored'] += written
+			manifest['chunks'].append({'name': chunk_name, 'size': len(chunk), 'blob': blob})
+
+		# Blobs go first, so a manifest never points at blobs that were not written.
+		os.makedirs(os.path.dirname(self._log_path(name)), exist_ok=True)
+		with open(self._log_path(name), 'a') as outf:
+			outf.write(json.dumps(manifest) + '\n')
+		return manifest, True
+
+	def checkout(self, name, revision=None):
+		manifest = self.revision(name, revision)
+		data = b''.join(self.get_blob(chunk['blob']) for chunk in manifest['chunks'])
+		if hashlib.sha1(data).hexdigest() != manifest['sha1']:
+			raise StoreException(f'{name!r} revision {manifest["revision"]} does not rebuild to the stored file')
+		return data
+
+	def stats(self):
+		# Bytes of all revisions as files versus bytes of the blobs on disk.
+		revisions = sum(len(self.revisions(name)) for name in self.maps())
+		files = sum(r['size'] for name in self.maps() for r in self.revisions(name))
+		blobs = blob_bytes = 0
+		for root, dirs, files_in_dir in os.walk(os.path.join(self.root, 'blobs')):
+			for f in files_in_dir:
+				blobs += 1
+				blob_bytes += os.path.getsize(os.path.join(root, f))
+		return {'maps': len(self.maps()), 'revisions': revisions, 'file_bytes': files, 'blobs': blobs, 'blob_bytes': blob_bytes}
+
+
+def diff(old, new):
+	# Compares two manifests chunk by chunk: [(chunk name, old size or None, new size or None)]
+	# for the chunks that differ; None means the chunk is not in that revision.
+	old_chunks = {chunk['name']: chunk for chunk in old['chunks']}
+	new_chunks = {chunk['name']: chunk for chunk in new['chunks']}
+	changes = []
+	for name in list(old_chunks) + [n for n in new_chunks if n not in old_chunks]:
+		a, b = old_chunks.get(name), new_chunks.get(name)
+		if a is None or b is None or a['blob'] != b['blob']:
+			changes.append((name, a and a['size'], b and b['size']))
+	return changes
+
+
+def format_changes(changes):
+	if not changes:
+		return 'no changes'
+	parts = []
+	for name, old_size, new_size in changes:
+		if old_size is None:
+			parts.append(f'+{name}')
+		elif new_size is None:
+			parts.append(f'-{name}')
+		else:
+			parts.append(f'{name} {new_size - old_size:+d}')
+	return ', '.join(parts)
+
+
+def main():
+	arg_parser = argparse.ArgumentParser(prog='alm_store', description='Keep map revisions with unchanged sections stored once.')
+	arg_parser.add_argument('--store', required=True, help='store directory')
+	commands = arg_parser.add_subparsers(dest='command', required=True)
+
+	commit = commands.add_parser('commit', help='add maps as new revisions')
+	commit.add_argument('filename', nargs='+')
+	commit.add_argument('-m', '--message', default='')
+	commit.add_argument('--name', help='map name, the file name without .gz/.xz by default')
+
+	log = commands.add_parser('log', help='list the maps, or the revisions of one map')
+	log.add_argument('name', nargs='?')
+
+	checkout = commands.add_parser('checkout', help='write a revision to a file')
+	checkout.add_argument('name')
+	checkout.add_argument('output', help='.gz/.xz to compress')
+	checkout.add_argument('-r', '--revision', type=int, help='latest by default; negative ones count from the end')
+
+	diff_command = commands.add_parser('diff', help='sections that changed between two revisions')
+	diff_command.add_argument('name')
+	diff_command.add_argument('old', type=int)
+	diff_command.add_argument('new', type=int, nargs='?', help='latest by default')
+
+	commands.add_parser('stats', help='file bytes of all revisions versus bytes stored')
+
+	args = arg_parser.parse_args()
+	store = Store(args.store)
+
+	try:
+		if args.command == 'commit':
+			if args.name and len(args.filename) > 1:
+				arg_parser.error('--name needs a single map')
+			for f in args.filename:
+				manifest, new = store.commit(f, args.name, args.message)
+				state = f'revision {manifest["revision"]}, {manifest["stored"]} bytes stored' if new else f'unchanged since revision {manifest["revision"]}'
+				print(f'{f}: {state}', file=sys.stderr)
+
+		elif args.command == 'log' and args.name is None:
+			for name in store.maps():
+				revisions = store.revisions(name)
+				print(f'{name}\t{len(revisions)} revisions\t{revisions[-1]["size"]} bytes')
+
+		elif args.command == 'log':
+			previous = None
+			for manifest in store.revisions(args.name):
+				when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(manifest['time']))
+				changes = format_changes(diff(previous, manifest)) if previous else 'added'
+				print(f'{manifest["revision"]}\t{when}\t{manifest["size"]}\t+{manifest["stored"]}\t{changes}\t{manifest["message"]}')
+				previous = manifest
+
+		elif args.command == 'checkout':
+			common.write_atomically(args.output, store.checkout(args.name, args.revision))
+
+		elif args.command == 'diff':
+			old = store.revision(args.name, args.old)
+			new = store.revision(args.name, args.new)
+			for name, old_size, new_size in diff(old, new):
+				print(f'{name}\t{"-" if old_size is None else old_size}\t{"-" if new_size is None else new_size}')
+
+		elif args.command == 'stats':
+			print(json.dumps(store.stats()))
+	except StoreException as error:
+		print(f'alm_store: {error}', file=sys.stderr)
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,190 @@
+import array
+import collections
+import operator
+import sys
+
+import a2data
+import compression
+import parser
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+# Landscape.tile layout: 0xF000 are flags, 0x0FF0 is the tile number and 0x000F picks one of
+# the pictures for it. Tile numbers come in runs of 0x10 per terrain kind.
+terrain_names = ['ground', 'grass', 'water', 'road']
+WATER = 2
+
+grid_sections = {1: ('tiles', 'H'), 2: ('heights', 'B'), 3: ('objects', 'B')}
+
+
+def terrain_kind(tile):
+	return (tile & 0xF00) >> 8
+
+
+def terrain_name(kind):
+	if kind < len(terrain_names):
+		return terrain_names[kind]
+	return f'kind_{kind}'
+
+
+class Layers:
+	# The tile, height and object grids of a map. With NumPy they are 2-D arrays of
+	# height x width, otherwise flat `array.array`s in row order.
+	def __init__(self, info, tiles, heights, objects):
+		self.info = info
+		self.width = info.width
+		self.height = info.height
+
+		if numpy is not None:
+			shape = (self.height, self.width)
+			self.tiles = numpy.asarray(tiles, dtype=numpy.uint16).reshape(shape)
+			self.heights = numpy.asarray(heights, dtype=numpy.uint8).reshape(shape)
+			self.objects = numpy.asarray(objects, dtype=numpy.uint8).reshape(shape)
+		else:
+			self.tiles = array.array('H', tiles)
+			self.heights = array.array('B', heights)
+			self.objects = array.array('B', objects)
+
+	def rows(self, layer):
+		for y in range(self.height):
+			yield layer[y * self.width:(y + 1) * self.width]
+
+
+def read_layers(data) -> Layers:
+	# Decodes the generic info and the grid sections in bulk, skipping everything else.
+	header, sections = parser.section_table(data)
+
+	info = None
+	grids = {}
+	for section_header, start, end in sections:
+		if section_header.id == 0:
+			reader = parser.GenericParser(data)
+			reader.p = start
+			info = reader.eat(a2data.GenericInfo())
+		elif section_header.id in grid_sections:
+			name, typecode = grid_sections[section_header.id]
+			grid = array.array(typecode)
+			grid.frombytes(data[start:end])
+			if sys.byteorder == 'big':
+				grid.byteswap()
+			grids[name] = grid
+
+	if info is None:
+		raise parser.ParseException('map has no generic info section')
+
+	for name, typecode in grid_sections.values():
+		if len(grids.get(name, [])) != info.width * info.height:
+			raise parser.ParseException(f'{name} grid has {len(grids.get(name, []))} cells, expected {info.width}x{info.height}')
+
+	return Layers(info, grids['tiles'], grids['heights'], grids['objects'])
+
+
+def load_layers(f) -> Layers:
+	with compression.open_file(f) as inf:
+		try:
+			return read_layers(inf.read())
+		except Exception as error:
+			raise parser.ParseException(f'failed to read grids from {f!r}') from error
+
+
+def layers_from_map(allods_map: a2data.AllodsMap) -> Layers:
+	return Layers(allods_map.info, allods_map.tiles, allods_map.heights, allods_map.objects)
+
+
+def terrain_stats(layers: Layers):
+	cells = layers.width * layers.height
+	if numpy is not None:
+		kinds = (layers.tiles & 0xF00) >> 8
+		kind_counts = dict(enumerate(numpy.bincount(kinds.ravel(), minlength=len(terrain_names)).tolist()))
+		passable = int(((kinds != WATER) & (layers.objects == 0)).sum())
+		objects = int(numpy.count_nonzero(layers.objects))
+
+		heights = layers.heights.astype(numpy.int32)
+		dx = numpy.abs(numpy.diff(heights, axis=1))
+		dy = numpy.abs(numpy.diff(heights, axis=0))
+		height_min, height_max = int(heights.min(initial=0)), int(heights.max(initial=0))
+		height_sum = int(heights.sum())
+		slope_max = max(int(dx.max(initial=0)), int(dy.max(initial=0)))
+		slope_sum, slope_count = int(dx.sum() + dy.sum()), dx.size + dy.size
+	else:
+		kinds = [terrain_kind(tile) for tile in layers.tiles]
+		kind_counts = collections.Counter(kinds)
+		passable = sum(1 for kind, o in zip(kinds, layers.objects) if kind != WATER and not o)
+		objects = cells - layers.objects.count(0)
+
+		heights = layers.heights
+		height_min, height_max = min(heights, default=0), max(heights, default=0)
+		height_sum = sum(heights)
+
+		slopes = []
+		previous = None
+		for row in layers.rows(heights):
+			slopes.extend(map(abs, map(operator.sub, row[1:], row[:-1])))
+			if previous is not None:
+				slopes.extend(map(abs, map(operator.sub, row, previous)))
+			previous = row
+		slope_max = max(slopes, default=0)
+		slope_sum, slope_count = sum(slopes), len(slopes)
+
+	return {
+		'map_name': layers.info.map_name,
+		'width': layers.width,
+		'height': layers.height,
+		'terrain': {terrain_name(kind): count for kind, count in sorted(kind_counts.items()) if count},
+		'height_min': height_min,
+		'height_max': height_max,
+		'height_mean': height_sum / cells if cells else 0,
+		'slope_max': slope_max,
+		'slope_mean': slope_sum / slope_count if slope_count else 0,
+		'object_density': objects / cells if cells else 0,
+		'passable_fraction': passable / cells if cells else 0,
+	}
+
+
+def corpus_summary(all_stats):
+	cells = sum(s['width'] * s['height'] for s in all_stats)
+	terrain = collections.Counter()
+	for s in all_stats:
+		terrain.update(s['terrain'])
+
+	def mean(key):
+		return sum(s[key] for s in all_stats) / len(all_stats) if all_stats else 0
+
+	return {
+		'maps': len(all_stats),
+		'cells': cells,
+		'terrain': {name: count / cells for name, count in terrain.items()} if cells else {},
+		'height_max': max((s['height_max'] for s in all_stats), default=0),
+		'slope_max': max((s['slope_max'] for s in all_stats), default=0),
+		'object_density_mean': mean('object_density'),
+		'passable_fraction_mean': mean('passable_fraction'),
+		'passable_fraction_min': min((s['passable_fraction'] for s in all_stats), default=0),
+	}
+
+
+def format_stats(fname, stats):
+	cells = stats['width'] * stats['height']
+	terrain = ', '.join(f'{name}={count / cells:.1%}' for name, count in stats['terrain'].items())
+	return (
+		f'{fname}: {stats["map_name"]} ({stats["width"]}x{stats["height"]})\n'
+		f'  terrain: {terrain}\n'
+		f'  heights: {stats["height_min"]}..{stats["height_max"]}, mean={stats["height_mean"]:.1f}, '
+		f'slope max={stats["slope_max"]}, mean={stats["slope_mean"]:.2f}\n'
+		f'  objects: {stats["object_density"]:.1%} of cells\n'
+		f'  passable: {stats["passable_fraction"]:.1%}\n'
+	)
+
+
+def format_summary(summary):
+	terrain = ', '.join(f'{name}={fraction:.1%}' for name, fraction in summary['terrain'].items())
+	return (
+		f'Total: {summary["maps"]} maps, {summary["cells"]} cells\n'
+		f'  terrain: {terrain}\n'
+		f'  highest point: {summary["height_max"]}, steepest slope: {summary["slope_max"]}\n'
+		f'  objects: {summary["object_density_mean"]:.1%} of cells on average\n'
+		f'  passable: {summary["passable_fraction_mean"]:.1%} on average, {summary["passable_fraction_min"]:.1%} at worst\n'
+	)
@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# Modules a single-map JSON run must not import: optional dependencies and the engine data,
+# which only some modes need (see the note at the top of alm_parser.py).
+not_at_startup = ['colorama', 'numpy', 'engine_index', 'terrain', 'minimap', 'reachability']
+
+# Wall time budgets in seconds, the best of `runs` runs. Scripts start alm_parser for every
+# single map, so these are what a map costs them besides its size.
+runs = 5
+help_budget = 0.25
+small_map_budget = 1.0
+
+
+def run(*args, importtime=False):
+	command = [sys.executable, *(['-X', 'importtime'] if importtime else []), os.path.join(here, 'alm_parser.py'), *args]
+	start = time.perf_counter()
+	result = subprocess.run(command, cwd=here, capture_output=True, text=True)
+	elapsed = time.perf_counter() - start
+	if result.returncode != 0:
+		raise AssertionError(f'{" ".join(args)} failed with {result.returncode}: {result.stderr}')
+	return result, elapsed
+
+
+def best_time(*args):
+	return min(run(*args)[1] for _ in range(runs))
+
+
+def imported_modules(*args):
+	result, elapsed = run(*args, importtime=True)
+	# "import time: self [us] | cumulative | imported package"
+	return {line.rsplit('|', 1)[1].strip() for line in result.stderr.splitlines() if line.startswith('import time:') and '|' in line}
+
+
+class StartupTest(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.directory = tempfile.TemporaryDirectory()
+		cls.small_map = os.path.join(cls.directory.name, 'small.alm')
+		counts = {'width': 64, 'height': 64, 'units': 20, 'groups': 5, 'bags': 10, 'effects': 5, 'triggers': 5, 'music': 2}
+		subprocess.run(
+			[sys.executable, os.path.join(here, 'generate.py'), cls.small_map, *[f'--set={k}={v}' for k, v in counts.items()]],
+			cwd=here, capture_output=True, check=True,
+		)
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.directory.cleanup()
+
+	def assert_not_imported(self, modules):
+		self.assertIn('parser', modules)
+		for name in not_at_startup:
+			self.assertFalse({m for m in modules if m == name or m.startswith(name + '.')}, f'{name} is imported')
+
+	def test_help_budget(self):
+		elapsed = best_time('--help')
+		self.assertLess(elapsed, help_budget, f'--help took {elapsed * 1000:.0f} ms')
+
+	def test_small_map_budget(self):
+		elapsed = best_time('--output_format', 'json', self.small_map)
+		self.assertLess(elapsed, small_map_budget, f'a small map took {elapsed * 1000:.0f} ms')
+
+	def test_help_imports_no_optional_modules(self):
+		self.assert_not_imported(imported_modules('--help'))
+
+	def test_json_needs_no_engine_data(self):
+		# The data directory does not exist: the run fails if anything is read from it.
+		missing = os.path.join(self.directory.name, 'no such directory')
+		self.assert_not_imported(imported_modules('--output_format', 'json', self.small_map, '-d', missing))
+
+
+if __name__ == '__main__':
+	unittest.main()
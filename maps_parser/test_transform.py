@@ -0,0 +1,73 @@
+import collections
+import json
+import os
+import tempfile
+import types
+import unittest
+
+import a2data
+import generate
+import transform
+
+
+def info_map(**fields):
+	info = a2data.GenericInfo(map_name='Old name', map_level=1, author_name='', **fields)
+	return types.SimpleNamespace(info=info)
+
+
+class EditTest(unittest.TestCase):
+	def apply(self, allods_map, spec):
+		changes = collections.Counter()
+		transform.Edit(spec).apply(allods_map, changes)
+		return changes
+
+	def test_string_field_is_set_to_literal(self):
+		allods_map = info_map()
+		changes = self.apply(allods_map, {'records': 'info', 'set': {'map_name': 'My New Map'}})
+		self.assertEqual(allods_map.info.map_name, 'My New Map')
+		self.assertEqual(changes['info.map_name'], 1)
+
+	def test_string_is_an_expression_for_numeric_field(self):
+		allods_map = info_map()
+		self.apply(allods_map, {'records': 'info', 'set': {'map_level': 'map_level + 2', 'author_name': 'map_level'}})
+		self.assertEqual(allods_map.info.map_level, 3)
+		self.assertEqual(allods_map.info.author_name, 'map_level')
+
+	def test_bad_expression(self):
+		with self.assertRaises(transform.TransformException):
+			self.apply(info_map(), {'records': 'info', 'set': {'map_level': 'map_level +'}})
+
+
+class TransformFilesTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directory.cleanup)
+		self.maps = [self.path('maps', 'a', 'x.alm'), self.path('maps', 'b', 'x.alm'), self.path('maps', 'a', 'junk.alm')]
+		spec = generate.load_spec(overrides=['width=32', 'height=32', 'units=5', 'groups=2', 'bags=2', 'effects=1', 'triggers=1', 'music=1'])
+		for i, f in enumerate(self.maps[:2]):
+			os.makedirs(os.path.dirname(f), exist_ok=True)
+			generate.write_map(dict(spec, seed=i), f)
+		with open(self.maps[2], 'wb') as outf:
+			outf.write(b'junk')
+
+		self.edits = self.path('edits.json')
+		with open(self.edits, 'w') as outf:
+			json.dump([{'records': 'groups', 'set': {'repop_time': 300}}], outf)
+
+	def path(self, *parts):
+		return os.path.join(self.directory.name, *parts)
+
+	def test_bad_map_does_not_stop_the_batch(self):
+		results = list(transform.transform_files(self.maps, self.edits, self.path('out')))
+		self.assertEqual([f for f, changes, error in results], self.maps)
+		self.assertEqual([error is None for f, changes, error in results], [True, True, False])
+		self.assertIn('junk.alm', results[2][2])
+
+	def test_same_names_in_different_directories(self):
+		list(transform.transform_files(self.maps, self.edits, self.path('out')))
+		self.assertTrue(os.path.exists(self.path('out', 'a', 'x.alm')))
+		self.assertTrue(os.path.exists(self.path('out', 'b', 'x.alm')))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,173 @@
+import collections
+import copy
+import functools
+import importlib.util
+import json
+import os
+
+import a2data
+import common
+import marshaller
+import parser
+
+
+class TransformException(Exception):
+	pass
+
+
+def records(allods_map: a2data.AllodsMap, kind):
+	if kind == 'info':
+		return [allods_map.info]
+	if kind in ('instances', 'checks'):
+		return list(getattr(allods_map, kind).values())
+	if kind == 'bag_items':
+		return [item for bag in allods_map.bags for item in bag.items]
+	if kind == 'effect_modifiers':
+		return [modifier for effect in allods_map.effects for modifier in effect.modifiers]
+	if kind in ('units', 'buildings', 'players', 'triggers', 'bags', 'effects', 'groups', 'inns', 'shops', 'signs', 'music'):
+		return getattr(allods_map, kind)
+	raise TransformException(f'unknown record kind {kind!r}')
+
+
+class Edit:
+	# One declarative edit: {"records": "units", "where": "...", "set": {"field": value or "expression"}}.
+	# String values of non-string fields are Python expressions over the record fields and map info.
+	def __init__(self, spec):
+		unknown = set(spec) - {'records', 'where', 'set'}
+		if unknown or 'records' not in spec or 'set' not in spec:
+			raise TransformException(f'edit must have "records", "set" and optionally "where": {spec}')
+
+		self.kind = spec['records']
+		self.where = self._compile(spec['where']) if 'where' in spec else None
+		# Whether a string is a literal or an expression depends on the field it is assigned
+		# to, so `set` expressions are only compiled when they are applied.
+		self.assignments = list(spec['set'].items())
+		self.expressions = {}
+
+	def _compile(self, expression):
+		if isinstance(expression, dict):
+			return expression
+		try:
+			return compile(expression, '<transform>', 'eval')
+		except SyntaxError as error:
+			raise TransformException(f'bad expression {expression!r}') from error
+
+	def _expression(self, expression):
+		if expression not in self.expressions:
+			self.expressions[expression] = self._compile(expression)
+		return self.expressions[expression]
+
+	def _matches(self, record, names):
+		if self.where is None:
+			return True
+		if isinstance(self.where, dict):
+			return all(getattr(record, k) == v for k, v in self.where.items())
+		return eval(self.where, {'__builtins__': common.expression_builtins}, names)
+
+	def apply(self, allods_map: a2data.AllodsMap, changes):
+		info = dict(allods_map.info.__dict__)
+		for record in records(allods_map, self.kind):
+			names = dict(info)
+			names.update(record.__dict__)
+			if not self._matches(record, names):
+				continue
+
+			for field, value in self.assignments:
+				if not hasattr(record, field):
+					raise TransformException(f'{self.kind} have no field {field!r}')
+				old = getattr(record, field)
+				if isinstance(value, str) and not isinstance(old, str):
+					value = eval(self._expression(value), {'__builtins__': common.expression_builtins}, names)
+				if isinstance(old, a2data.Hex):
+					value = a2data.Hex(value)
+				if value != old:
+					setattr(record, field, value)
+					changes[f'{self.kind}.{field}'] += 1
+
+
+class Transform:
+	def __init__(self, edits=(), function=None):
+		self.edits = [Edit(e) for e in edits]
+		self.function = function
+
+	def apply(self, allods_map: a2data.AllodsMap):
+		changes = collections.Counter()
+		for edit in self.edits:
+			edit.apply(allods_map, changes)
+		if self.function is not None:
+			before = copy.deepcopy(allods_map)
+			self.function(allods_map)
+			changes.update(diff_maps(before, allods_map))
+		return changes
+
+
+def diff_maps(before: a2data.AllodsMap, after: a2data.AllodsMap):
+	# Counts changed fields per record kind; used for the summary of Python transforms.
+	changes = collections.Counter()
+	for kind in ('info', 'units', 'buildings', 'players', 'instances', 'checks', 'triggers', 'bags', 'bag_items',
+			'effects', 'effect_modifiers', 'groups', 'inns', 'shops', 'signs', 'music'):
+		old, new = records(before, kind), records(after, kind)
+		if len(old) != len(new):
+			changes[f'{kind}.count'] += 1
+		for a, b in zip(old, new):
+			for field, value in b.__dict__.items():
+				if field not in ('items', 'modifiers') and getattr(a, field, None) != value:
+					changes[f'{kind}.{field}'] += 1
+	for kind in ('tiles', 'heights', 'objects'):
+		if getattr(before, kind) != getattr(after, kind):
+			changes[kind] += sum(1 for a, b in zip(getattr(before, kind), getattr(after, kind)) if a != b)
+	return changes
+
+
+@functools.lru_cache(maxsize=None)
+def load_transform(spec_file) -> Transform:
+	# A .json file holds a list of edits, a .py file defines `transform(allods_map)` and/or `edits`.
+	if spec_file.endswith('.py'):
+		spec = importlib.util.spec_from_file_location('map_transform', spec_file)
+		module = importlib.util.module_from_spec(spec)
+		spec.loader.exec_module(module)
+		return Transform(getattr(module, 'edits', []), getattr(module, 'transform', None))
+
+	with open(spec_file, 'r') as inf:
+		edits = json.load(inf)
+	if isinstance(edits, dict):
+		edits = [edits]
+	return Transform(edits)
+
+
+def transform_file(fname, spec_file, target=None, dry_run=False):
+	# Returns (fname, change counts, None), or (fname, None, error message) for a map that could
+	# not be read, transformed or written. The map is written to `target` (by default over
+	# `fname`) unless this is a dry run or nothing changed.
+	transform = load_transform(spec_file)
+	try:
+		allods_map = parser.parse(fname)
+		changes = transform.apply(allods_map)
+
+		if changes and not dry_run:
+			target = target or fname
+			os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+			common.write_atomically(target, marshaller.Marshaller(allods_map).marshal())
+	except TransformException as error:
+		return fname, None, f'failed to transform {fname!r}: {common.error_message(error)}'
+	except (parser.ParseException, OSError) as error:
+		return fname, None, common.error_message(error)
+	return fname, changes, None
+
+
+def transform_files(filenames, spec_file, output_directory=None, dry_run=False, jobs=1):
+	# Yields the results of `transform_file` in the order of `filenames`. With `output_directory`
+	# the maps keep the subdirectories they are in (see `common.output_paths`).
+	load_transform(spec_file)
+	targets = common.output_paths(filenames, output_directory) if output_directory else {}
+
+	if jobs <= 1:
+		for f in filenames:
+			yield transform_file(f, spec_file, targets.get(f), dry_run)
+		return
+
+	import concurrent.futures
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+		futures = [executor.submit(transform_file, f, spec_file, targets.get(f), dry_run) for f in filenames]
+		for future in futures:
+			yield future.result()
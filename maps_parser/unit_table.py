@@ -0,0 +1,131 @@
+import csv
+import json
+import struct
+
+import a2data
+import common
+import parser
+
+
+binary_signature = b'A2UT'
+binary_version = 1
+
+# Column type codes of the binary format.
+INT = b'i'
+HEX = b'h'
+STR = b's'
+
+
+def _columns():
+	# (column, field, index, type) for every field of UnitMonster and UnitHuman; list fields
+	# get one column per element.
+	columns = [('name', 'name', None, STR), ('category', None, None, STR)]
+	seen = {'name'}
+	for cls in (a2data.UnitMonster, a2data.UnitHuman):
+		for field, data_type in cls._fields:
+			if field in seen or data_type is None:
+				continue
+			seen.add(field)
+			if isinstance(data_type, list):
+				for i, element in enumerate(data_type):
+					columns.append((f'{field}_{i}', field, i, HEX if isinstance(element, a2data.Hex) else INT))
+			else:
+				columns.append((field, field, None, HEX if isinstance(data_type, a2data.Hex) else INT))
+	columns.append(('items', 'items', None, STR))
+	return columns
+
+
+columns = _columns()
+
+
+def unit_row(unit):
+	row = {}
+	for column, field, index, column_type in columns:
+		if field is None:
+			row[column] = 'monster' if isinstance(unit, a2data.UnitMonster) else 'human'
+		elif not hasattr(unit, field):
+			row[column] = None
+		elif field == 'items':
+			row[column] = ';'.join(unit.items or [])
+		elif index is not None:
+			row[column] = int(getattr(unit, field)[index])
+		else:
+			value = getattr(unit, field)
+			row[column] = value if column_type == STR else int(value)
+	return row
+
+
+def build_table(unit_kinds, where=None):
+	# Columnar table: column -> list of values, rows in server_id order. `where` is an expression
+	# over the columns, e.g. "category == 'monster' and hp > 1000".
+	code = compile(where, '<filter>', 'eval') if where else None
+	table = {column: [] for column, field, index, column_type in columns}
+	for server_id in sorted(unit_kinds):
+		row = unit_row(unit_kinds[server_id])
+		if code is not None and not eval(code, {'__builtins__': common.expression_builtins}, row):
+			continue
+		for column, value in row.items():
+			table[column].append(value)
+	return table
+
+
+def rows(table):
+	names = list(table)
+	for values in zip(*table.values()):
+		yield dict(zip(names, values))
+
+
+def write_csv(table, out):
+	writer = csv.writer(out, lineterminator='\n')
+	writer.writerow(table)
+	for row in rows(table):
+		writer.writerow(['' if v is None else v for v in row.values()])
+
+
+def write_jsonl(table, out):
+	for row in rows(table):
+		out.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+def write_binary(table, out):
+	# signature, version, row count, column count, then for every column: name, type, a null byte
+	# per row and the values (uint32 or length-prefixed utf-8).
+	types = {column: column_type for column, field, index, column_type in columns}
+	count = len(next(iter(table.values()), []))
+
+	out.write(binary_signature + struct.pack('<III', binary_version, count, len(table)))
+	for column, values in table.items():
+		name = column.encode('utf-8')
+		out.write(struct.pack('<B', len(name)) + name + types[column])
+		out.write(bytes(1 if v is None else 0 for v in values))
+		if types[column] == STR:
+			for v in values:
+				data = (v or '').encode('utf-8')
+				out.write(struct.pack('<H', len(data)) + data)
+		else:
+			out.write(struct.pack(f'<{count}I', *(v or 0 for v in values)))
+
+
+def read_binary(inf):
+	if inf.read(4) != binary_signature:
+		raise parser.ParseException('not a unit table file')
+	version, count, num_columns = struct.unpack('<III', inf.read(12))
+	if version != binary_version:
+		raise parser.ParseException(f'unhandled unit table version: {version} != {binary_version}')
+
+	table = {}
+	for i in range(num_columns):
+		name = inf.read(inf.read(1)[0]).decode('utf-8')
+		column_type = inf.read(1)
+		nulls = inf.read(count)
+		if column_type == STR:
+			values = []
+			for j in range(count):
+				size, = struct.unpack('<H', inf.read(2))
+				values.append(inf.read(size).decode('utf-8'))
+		else:
+			values = list(struct.unpack(f'<{count}I', inf.read(4 * count)))
+			if column_type == HEX:
+				values = [a2data.Hex(v) for v in values]
+		table[name] = [None if null else v for v, null in zip(values, nulls)]
+	return table
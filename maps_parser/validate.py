@@ -0,0 +1,139 @@
+import collections
+
+import a2data
+import parser
+
+
+severities = ['error', 'warning']
+
+
+def check_bag_references(allods_map: a2data.AllodsMap):
+	for unit in allods_map.units:
+		if unit.bag_id and not 0 < unit.bag_id <= len(allods_map.bags):
+			yield f'unit {unit.unit_id} has bag {unit.bag_id}, the map has {len(allods_map.bags)} bags'
+	unit_ids = {unit.unit_id for unit in allods_map.units}
+	for i, bag in enumerate(allods_map.bags):
+		if bag.unit_id and bag.unit_id not in unit_ids:
+			yield f'bag {i + 1} belongs to missing unit {bag.unit_id}'
+
+
+def check_effect_references(allods_map: a2data.AllodsMap):
+	for i, bag in enumerate(allods_map.bags):
+		for item in bag.items:
+			if item.effect and not 0 < item.effect <= len(allods_map.effects):
+				yield f'item {item.item_id} in bag {i + 1} has effect {item.effect}, the map has {len(allods_map.effects)} effects'
+
+
+def check_group_references(allods_map: a2data.AllodsMap):
+	group_ids = {group.group_id for group in allods_map.groups}
+	for unit in allods_map.units:
+		if unit.group_id and unit.group_id not in group_ids:
+			yield f'unit {unit.unit_id} is in missing group {unit.group_id}'
+
+
+def check_unit_ids(allods_map: a2data.AllodsMap):
+	counts = collections.Counter(unit.unit_id for unit in allods_map.units)
+	for unit_id, count in sorted(counts.items()):
+		if count > 1:
+			yield f'{count} units have ID {unit_id}'
+
+
+def check_hp(allods_map: a2data.AllodsMap):
+	# 65535 is the "use the unit kind's value" default.
+	for unit in allods_map.units:
+		if unit.hp != 65535 and unit.max_hp != 65535 and unit.hp > unit.max_hp:
+			yield f'unit {unit.unit_id} has {unit.hp} HP, more than its maximum {unit.max_hp}'
+
+
+def check_bounds(allods_map: a2data.AllodsMap):
+	width, height = allods_map.info.width, allods_map.info.height
+	for kind, records in (('unit', allods_map.units), ('building', allods_map.buildings), ('bag', allods_map.bags)):
+		for i, record in enumerate(records):
+			if not (0 <= record.x < width and 0 <= record.y < height):
+				yield f'{kind} {i + 1} at ({record.x}, {record.y}) is outside the {width}x{height} map'
+
+
+def check_trigger_references(allods_map: a2data.AllodsMap):
+	for trigger in allods_map.triggers:
+		for check_id in trigger.check_ids:
+			if check_id and check_id not in allods_map.checks:
+				yield f'trigger {trigger.name!r} uses missing check {check_id}'
+		for instance_id in trigger.instance_ids:
+			if instance_id and instance_id not in allods_map.instances:
+				yield f'trigger {trigger.name!r} uses missing instance {instance_id}'
+
+
+def check_effect_buildings(allods_map: a2data.AllodsMap):
+	# On-map effects (with a position) may be cast from a building, see the text report.
+	building_ids = {building.building_id for building in allods_map.buildings}
+	for i, effect in enumerate(allods_map.effects):
+		if effect.x == 0 or effect.y == 0:
+			continue
+		building_id = effect.max_magic_damage * 256 + effect.min_magic_damage
+		if building_id and building_id not in building_ids:
+			yield f'effect {i + 1} at ({effect.x}, {effect.y}) is cast from missing building {building_id}'
+		if len(effect.modifiers) not in (0, 2):
+			yield f'effect {i + 1} at ({effect.x}, {effect.y}) has {len(effect.modifiers)} modifiers instead of 0 or 2'
+
+
+def check_players(allods_map: a2data.AllodsMap):
+	num_players = len(allods_map.players)
+	for unit in allods_map.units:
+		if not 0 < unit.player_id <= num_players:
+			yield f'unit {unit.unit_id} belongs to player {unit.player_id}, the map has {num_players} players'
+	for building in allods_map.buildings:
+		if not 0 < building.player <= num_players:
+			yield f'building {building.building_id} belongs to player {building.player}, the map has {num_players} players'
+
+
+# (name, severity, check, ids of the sections it reads); a check yields one message per problem.
+checks = [
+	('bag_references', 'error', check_bag_references, {6, 8}),
+	('effect_references', 'error', check_effect_references, {8, 9}),
+	('group_references', 'warning', check_group_references, {6, 10}),
+	('unit_ids', 'error', check_unit_ids, {6}),
+	('hp', 'warning', check_hp, {6}),
+	('bounds', 'error', check_bounds, {0, 4, 6, 8}),
+	('trigger_references', 'error', check_trigger_references, {7}),
+	('effect_buildings', 'warning', check_effect_buildings, {4, 9}),
+	('players', 'error', check_players, {4, 5, 6}),
+]
+
+
+def validate_map(allods_map: a2data.AllodsMap, skipped=()):
+	# Checks that read a section in `skipped` (one that could not be parsed) are not run:
+	# its records are missing, and everything referring to them would look broken.
+	findings = []
+	for name, severity, check, sections in checks:
+		missing = sorted(sections & set(skipped))
+		if missing:
+			findings.append({'check': name, 'severity': 'warning', 'message': f'not checked: section {", ".join(map(str, missing))} could not be read'})
+			continue
+		try:
+			for message in check(allods_map):
+				findings.append({'check': name, 'severity': severity, 'message': message})
+		except Exception as error:
+			findings.append({'check': name, 'severity': 'error', 'message': f'check failed: {str(error) or error.__class__.__name__}'})
+	return findings
+
+
+def validate_file(fname):
+	# Damaged maps are read in recovering mode: the parse problems become findings and
+	# the checks run on whatever could be read. Returns (fname, findings, whether the map
+	# could be read at all).
+	allods_map, diagnostics, skipped = parser.scan_sections(fname)
+	findings = [{'check': 'parse', 'severity': d['severity'], 'message': d['message']} for d in diagnostics]
+	if allods_map is not None:
+		findings.extend(validate_map(allods_map, skipped))
+	return fname, findings, allods_map is not None
+
+
+def validate_files(filenames, jobs=1):
+	if jobs <= 1:
+		for f in filenames:
+			yield validate_file(f)
+		return
+
+	import concurrent.futures
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+		yield from executor.map(validate_file, filenames, chunksize=8)